@@ -86,13 +86,17 @@ class RailgunBridge:
             logger.error(f"Command execution failed: {e}")
             return {"success": False, "error": str(e)}
 
-    def initialize(self, rpc_url: Optional[str] = None, private_key: Optional[str] = None) -> Dict[str, Any]:
+    def initialize(self, rpc_url: Optional[str] = None, private_key: Optional[str] = None,
+                   chain_id: Optional[int] = None) -> Dict[str, Any]:
         try:
             command = ['init', self.network]
-            if rpc_url:
-                command.append(rpc_url)
-            if private_key:
-                command.append(private_key)
+            if chain_id:
+                command.extend([rpc_url or '', private_key or '', str(chain_id)])
+            else:
+                if rpc_url:
+                    command.append(rpc_url)
+                if private_key:
+                    command.append(private_key)
 
             result = self._run_js_command(command, timeout=120)
 
@@ -157,12 +161,12 @@ class RailgunBridge:
             logger.error(f"Failed to get balances: {e}")
             return {"success": False, "error": str(e)}
 
-    def shield_tokens(self, token_address: str, amount: str, gas_price: Optional[str] = None) -> TransactionResult:
+    def shield_tokens(self, token_address: str, amount: int, gas_price: Optional[str] = None) -> TransactionResult:
         try:
             if not self.wallet:
                 return TransactionResult(success=False, error="No wallet loaded")
 
-            command = ['shield', token_address, amount]
+            command = ['shield', token_address, str(amount)]
             if gas_price:
                 command.append(gas_price)
 
@@ -180,13 +184,13 @@ class RailgunBridge:
             logger.error(f"Shield failed: {e}")
             return TransactionResult(success=False, error=str(e))
 
-    def unshield_tokens(self, token_address: str, amount: str, recipient_address: str,
+    def unshield_tokens(self, token_address: str, amount: int, recipient_address: str,
                         gas_price: Optional[str] = None) -> TransactionResult:
         try:
             if not self.wallet:
                 return TransactionResult(success=False, error="No wallet loaded")
 
-            command = ['unshield', token_address, amount, recipient_address]
+            command = ['unshield', token_address, str(amount), recipient_address]
             if gas_price:
                 command.append(gas_price)
 
@@ -204,13 +208,13 @@ class RailgunBridge:
             logger.error(f"Unshield failed: {e}")
             return TransactionResult(success=False, error=str(e))
 
-    def private_transfer(self, token_address: str, amount: str, recipient_railgun_address: str,
+    def private_transfer(self, token_address: str, amount: int, recipient_railgun_address: str,
                          gas_price: Optional[str] = None) -> TransactionResult:
         try:
             if not self.wallet:
                 return TransactionResult(success=False, error="No wallet loaded")
 
-            command = ['transfer', token_address, amount, recipient_railgun_address]
+            command = ['transfer', token_address, str(amount), recipient_railgun_address]
             if gas_price:
                 command.append(gas_price)
 
@@ -258,7 +262,7 @@ class RailgunBridge:
             "mnemonic": self.wallet.mnemonic if self.wallet.mnemonic else "Not available"
         }
 
-    def complete_transfer_process(self, token_address: str, amount: str, recipient_address: str) -> Dict[str, Any]:
+    def complete_transfer_process(self, token_address: str, amount: int, recipient_address: str) -> Dict[str, Any]:
         try:
             results = {
                 "shield": None,
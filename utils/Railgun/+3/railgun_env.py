@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2025 Linkora DEX
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+# For commercial licensing, contact: licensing@linkora.info
+
+
+# Общая загрузка .env для скриптов этой папки: один кэш на процесс,
+# даже если railgun_example и simple_transfer импортированы вместе
+
+from functools import lru_cache
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=1)
+def ensure_env():
+    # Загрузка переменных окружения из файла .env (один раз на процесс)
+    load_dotenv()
+    return True
@@ -20,33 +20,42 @@
 
 
 from railgun_bridge import RailgunBridge, RailgunConfig
+from eth_utils import is_address, to_checksum_address
+from functools import lru_cache
+import asyncio
+import json
 import logging
-import time
 import os
 import sys
-from dotenv import load_dotenv
+from railgun_env import ensure_env
 
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_config = RailgunConfig()
+_token_lookup = lru_cache(maxsize=64)(_config.get_token_address)
 
-def get_env_vars():
-    required_vars = {
-        'PRIVATE_KEY': os.getenv('PRIVATE_KEY'),
-        'WALLET_MNEMONIC': os.getenv('WALLET_MNEMONIC'),
-        'TOKEN_SYMBOL': os.getenv('TOKEN_SYMBOL', 'MATIC'),
-        'AMOUNT': os.getenv('AMOUNT'),
-        'RECIPIENT_ADDRESS': os.getenv('RECIPIENT_ADDRESS'),
-        'NETWORK': os.getenv('NETWORK', 'polygon')
-    }
+
+def get_env_vars(overrides=None):
+    ensure_env()
+    env = dict(os.environ)
+    if overrides:
+        env.update(overrides)
+
+    required_vars = {key: env.get(key, default) for key, default in (
+        ('PRIVATE_KEY', None),
+        ('WALLET_MNEMONIC', None),
+        ('TOKEN_SYMBOL', 'MATIC'),
+        ('AMOUNT', None),
+        ('RECIPIENT_ADDRESS', None),
+        ('NETWORK', 'polygon')
+    )}
 
     optional_vars = {
-        'RPC_URL': os.getenv('RPC_URL'),
-        'GAS_PRICE': os.getenv('GAS_PRICE'),
-        'WAIT_TIME': int(os.getenv('WAIT_TIME', '30'))
+        'RPC_URL': env.get('RPC_URL'),
+        'GAS_PRICE': env.get('GAS_PRICE'),
+        'WAIT_TIME': 30
     }
 
     missing_required = [key for key, value in required_vars.items() if not value]
@@ -68,32 +77,40 @@ def get_env_vars():
         print("  WAIT_TIME - Wait time between operations (default: 30)")
         return None, None
 
+    wait_time = env.get('WAIT_TIME')
+    if wait_time:
+        try:
+            optional_vars['WAIT_TIME'] = int(wait_time)
+        except ValueError:
+            print(f"Warning: Invalid WAIT_TIME '{wait_time}', using default {optional_vars['WAIT_TIME']}")
+
+    try:
+        required_vars['AMOUNT'] = int(required_vars['AMOUNT'])
+    except ValueError:
+        print(f"Error: Invalid amount '{required_vars['AMOUNT']}'. Must be a number.")
+        return None, None
+
     return required_vars, optional_vars
 
 
-def validate_inputs(required_vars, config):
+def validate_inputs(required_vars):
     network = required_vars['NETWORK']
     token_symbol = required_vars['TOKEN_SYMBOL']
-    amount = required_vars['AMOUNT']
     recipient = required_vars['RECIPIENT_ADDRESS']
 
     try:
-        config.get_token_address(network, token_symbol)
+        token_address = _token_lookup(network, token_symbol)
     except ValueError as e:
         print(f"Error: {e}")
-        return False
+        return False, None
 
-    try:
-        int(amount)
-    except ValueError:
-        print(f"Error: Invalid amount '{amount}'. Must be a number.")
-        return False
-
-    if not recipient.startswith('0x') or len(recipient) != 42:
+    if not is_address(recipient):
         print(f"Error: Invalid recipient address '{recipient}'")
-        return False
+        return False, None
 
-    return True
+    required_vars['RECIPIENT_ADDRESS'] = to_checksum_address(recipient)
+
+    return True, token_address
 
 
 def display_transfer_info(required_vars, optional_vars, token_address):
@@ -108,100 +125,151 @@ def display_transfer_info(required_vars, optional_vars, token_address):
     print("=" * 50)
 
 
-def auto_transfer():
-    required_vars, optional_vars = get_env_vars()
-    if not required_vars:
-        return False
+BATCH_KEYS = ('TOKEN_SYMBOL', 'AMOUNT', 'RECIPIENT_ADDRESS')
 
-    config = RailgunConfig()
 
-    if not validate_inputs(required_vars, config):
-        return False
+def print_tx_result(label, title, result):
+    print(f"{label}✓ {title}: {result.tx_hash}")
+    print(f"{label}  Gas used: {result.gas_used}")
+    print(f"{label}  Block: {result.block_number}")
 
-    try:
-        token_address = config.get_token_address(required_vars['NETWORK'], required_vars['TOKEN_SYMBOL'])
 
-        display_transfer_info(required_vars, optional_vars, token_address)
+def init_bridge(required_vars, optional_vars):
+    bridge = RailgunBridge(required_vars['NETWORK'])
+    chain_id = _config.get_network_info(required_vars['NETWORK'])['chain_id']
 
-        bridge = RailgunBridge(required_vars['NETWORK'])
+    print("\n1. Initializing Railgun...")
+    init_result = bridge.initialize(optional_vars['RPC_URL'], required_vars['PRIVATE_KEY'], chain_id)
 
-        print("\n1. Initializing Railgun...")
-        init_result = bridge.initialize(optional_vars['RPC_URL'], required_vars['PRIVATE_KEY'])
+    if not init_result.get('success'):
+        print(f"✗ Initialization failed: {init_result.get('error')}")
+        return None
 
-        if not init_result.get('success'):
-            print(f"✗ Initialization failed: {init_result.get('error')}")
-            return False
+    print(f"✓ Initialized on {required_vars['NETWORK']}")
 
-        print(f"✓ Initialized on {required_vars['NETWORK']}")
+    print("\n2. Loading Railgun wallet...")
+    wallet_result = bridge.load_wallet(required_vars['WALLET_MNEMONIC'])
 
-        print("\n2. Loading Railgun wallet...")
-        wallet_result = bridge.load_wallet(required_vars['WALLET_MNEMONIC'])
+    if not wallet_result.get('success'):
+        print(f"✗ Wallet loading failed: {wallet_result.get('error')}")
+        return None
 
-        if not wallet_result.get('success'):
-            print(f"✗ Wallet loading failed: {wallet_result.get('error')}")
-            return False
+    print(f"✓ Wallet loaded: {bridge.wallet.address}")
+    return bridge
 
-        print(f"✓ Wallet loaded: {bridge.wallet.address}")
 
-        print("\n3. Starting shield operation...")
-        shield_result = bridge.shield_tokens(
-            token_address,
-            required_vars['AMOUNT'],
-            optional_vars['GAS_PRICE']
-        )
+def make_locks():
+    # signer: все фазы отправляют транзакции с одного EOA, одновременная отправка взяла бы один nonce.
+    # notes: transfer и unshield тратят приватные ноты одного кошелька и не должны пересекаться
+    # между переводами. Параллельно с чужими фазами идут только ожидания подтверждений.
+    return {'signer': asyncio.Lock(), 'notes': asyncio.Lock()}
 
-        if not shield_result.success:
-            print(f"✗ Shield failed: {shield_result.error}")
-            return False
 
-        print(f"✓ Shield completed: {shield_result.tx_hash}")
-        print(f"  Gas used: {shield_result.gas_used}")
-        print(f"  Block: {shield_result.block_number}")
+async def submit(locks, func, *args):
+    async with locks['signer']:
+        return await asyncio.to_thread(func, *args)
 
-        print(f"\n4. Waiting {optional_vars['WAIT_TIME']} seconds for confirmation...")
-        time.sleep(optional_vars['WAIT_TIME'])
 
-        print("\n5. Starting private transfer...")
-        transfer_result = bridge.private_transfer(
-            token_address,
-            required_vars['AMOUNT'],
-            bridge.wallet.address,
-            optional_vars['GAS_PRICE']
-        )
+async def spend_notes(bridge, required_vars, token_address, amount, gas_price, wait_time, locks, label):
+    print(f"\n{label}5. Starting private transfer...")
+    transfer_result = await submit(
+        locks, bridge.private_transfer, token_address, amount, bridge.wallet.address, gas_price
+    )
 
-        if not transfer_result.success:
-            print(f"✗ Private transfer failed: {transfer_result.error}")
-            return False
+    if not transfer_result.success:
+        print(f"{label}✗ Private transfer failed: {transfer_result.error}")
+        return None
+
+    print_tx_result(label, "Private transfer completed", transfer_result)
+
+    print(f"\n{label}6. Waiting {wait_time} seconds for confirmation...")
+    await asyncio.sleep(wait_time)
+
+    print(f"\n{label}7. Starting unshield operation...")
+    unshield_result = await submit(
+        locks, bridge.unshield_tokens, token_address, amount, required_vars['RECIPIENT_ADDRESS'], gas_price
+    )
+
+    if not unshield_result.success:
+        print(f"{label}✗ Unshield failed: {unshield_result.error}")
+        return None
+
+    print_tx_result(label, "Unshield completed", unshield_result)
+
+    return transfer_result, unshield_result
+
+
+async def run_one(bridge, required_vars, optional_vars, token_address, locks, label=""):
+    amount = required_vars['AMOUNT']
+    gas_price = optional_vars['GAS_PRICE']
+    wait_time = optional_vars['WAIT_TIME']
+
+    print(f"\n{label}3. Starting shield operation...")
+    shield_result = await submit(locks, bridge.shield_tokens, token_address, amount, gas_price)
+
+    if not shield_result.success:
+        print(f"{label}✗ Shield failed: {shield_result.error}")
+        return None
+
+    print_tx_result(label, "Shield completed", shield_result)
 
-        print(f"✓ Private transfer completed: {transfer_result.tx_hash}")
-        print(f"  Gas used: {transfer_result.gas_used}")
-        print(f"  Block: {transfer_result.block_number}")
+    print(f"\n{label}4. Waiting {wait_time} seconds for confirmation...")
+    await asyncio.sleep(wait_time)
 
-        print(f"\n6. Waiting {optional_vars['WAIT_TIME']} seconds for confirmation...")
-        time.sleep(optional_vars['WAIT_TIME'])
+    # Ноты кошелька заняты от transfer до завершения unshield этого перевода
+    async with locks['notes']:
+        spent = await spend_notes(bridge, required_vars, token_address, amount, gas_price, wait_time, locks, label)
+    if not spent:
+        return None
 
-        print("\n7. Starting unshield operation...")
-        unshield_result = bridge.unshield_tokens(
-            token_address,
-            required_vars['AMOUNT'],
-            required_vars['RECIPIENT_ADDRESS'],
-            optional_vars['GAS_PRICE']
-        )
+    return (shield_result, *spent)
 
-        if not unshield_result.success:
-            print(f"✗ Unshield failed: {unshield_result.error}")
+
+async def run_batch(bridge, transfers, optional_vars):
+    # Shield следующего перевода выполняется, пока предыдущий ждёт подтверждений
+    locks = make_locks()
+
+    async def run_entry(index, transfer):
+        if transfer is None:
+            return None
+        required_vars, token_address = transfer
+        return await run_one(bridge, required_vars, optional_vars, token_address, locks, label=f"[{index}] ")
+
+    return await asyncio.gather(*(run_entry(index, transfer) for index, transfer in enumerate(transfers, 1)))
+
+
+def summary_lines(shield_result, transfer_result, unshield_result):
+    return [
+        f"  Shield TX: {shield_result.tx_hash}",
+        f"  Transfer TX: {transfer_result.tx_hash}",
+        f"  Unshield TX: {unshield_result.tx_hash}",
+        f"  Total gas used: {int(shield_result.gas_used or 0) + int(transfer_result.gas_used or 0) + int(unshield_result.gas_used or 0)}"
+    ]
+
+
+def auto_transfer():
+    required_vars, optional_vars = get_env_vars()
+    if not required_vars:
+        return False
+
+    ok, token_address = validate_inputs(required_vars)
+    if not ok:
+        return False
+
+    try:
+        display_transfer_info(required_vars, optional_vars, token_address)
+
+        bridge = init_bridge(required_vars, optional_vars)
+        if not bridge:
             return False
 
-        print(f"✓ Unshield completed: {unshield_result.tx_hash}")
-        print(f"  Gas used: {unshield_result.gas_used}")
-        print(f"  Block: {unshield_result.block_number}")
+        results = asyncio.run(run_one(bridge, required_vars, optional_vars, token_address, make_locks()))
+        if not results:
+            return False
 
-        print("\n🎉 Complete transfer process finished successfully!")
-        print("\nSummary:")
-        print(f"  Shield TX: {shield_result.tx_hash}")
-        print(f"  Transfer TX: {transfer_result.tx_hash}")
-        print(f"  Unshield TX: {unshield_result.tx_hash}")
-        print(f"  Total gas used: {int(shield_result.gas_used or 0) + int(transfer_result.gas_used or 0) + int(unshield_result.gas_used or 0)}")
+        out = ["\n🎉 Complete transfer process finished successfully!", "\nSummary:"]
+        out.extend(summary_lines(*results))
+        sys.stdout.write("\n".join(out) + "\n")
 
         return True
 
@@ -214,6 +282,76 @@ def auto_transfer():
         return False
 
 
+def batch_transfer(batch_file):
+    try:
+        with open(batch_file) as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error: Cannot read batch file '{batch_file}': {e}")
+        return False
+
+    if not isinstance(entries, list) or not entries:
+        print(f"Error: Batch file '{batch_file}' must contain a non-empty JSON list")
+        return False
+
+    # Невалидная запись не прерывает пакет, а попадает в итог как неудачная
+    transfers = []
+    optional_vars = None
+
+    for index, entry in enumerate(entries, 1):
+        transfer = None
+        if not isinstance(entry, dict):
+            print(f"[{index}] Error: Batch entry must be a JSON object, got {type(entry).__name__}")
+        else:
+            overrides = {key: str(entry[key]) for key in BATCH_KEYS if key in entry}
+            required_vars, entry_optional_vars = get_env_vars(overrides)
+            if required_vars:
+                ok, token_address = validate_inputs(required_vars)
+                if ok:
+                    transfer = (required_vars, token_address)
+                    optional_vars = optional_vars or entry_optional_vars
+        transfers.append(transfer)
+
+    valid = [transfer for transfer in transfers if transfer]
+    if not valid:
+        print(f"Error: Batch file '{batch_file}' has no valid transfers")
+        return False
+
+    try:
+        print(f"RAILGUN Batch Transfer: {len(valid)} of {len(transfers)} transfers")
+        for index, transfer in enumerate(transfers, 1):
+            if transfer is None:
+                print(f"[{index}] ✗ Invalid entry, skipped")
+                continue
+            required_vars = transfer[0]
+            print(f"[{index}] {required_vars['AMOUNT']} {required_vars['TOKEN_SYMBOL']} -> {required_vars['RECIPIENT_ADDRESS']}")
+
+        bridge = init_bridge(valid[0][0], optional_vars)
+        if not bridge:
+            return False
+
+        results = asyncio.run(run_batch(bridge, transfers, optional_vars))
+
+        out = ["\nSummary:"]
+        for index, result in enumerate(results, 1):
+            if result:
+                out.append(f"[{index}] ✓")
+                out.extend(summary_lines(*result))
+            else:
+                out.append(f"[{index}] ✗ Failed")
+        sys.stdout.write("\n".join(out) + "\n")
+
+        return all(results)
+
+    except KeyboardInterrupt:
+        print("\n\nProcess interrupted by user")
+        return False
+    except Exception as e:
+        logger.error(f"Batch transfer failed: {e}")
+        print(f"\n✗ Batch transfer failed: {e}")
+        return False
+
+
 def interactive_mode():
     print("RAILGUN Interactive Transfer")
     print("=" * 40)
@@ -238,6 +376,8 @@ def interactive_mode():
 def main():
     if len(sys.argv) > 1 and sys.argv[1] == "--interactive":
         success = interactive_mode()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--batch":
+        success = batch_transfer(sys.argv[2])
     else:
         success = auto_transfer()
 
@@ -28,14 +28,16 @@ class RailgunJSWrapper {
     this.isInitialized = false;
   }
 
-  async initialize(network = 'polygon', rpcUrl = null, privateKey = null) {
+  async initialize(network = 'polygon', rpcUrl = null, privateKey = null, chainId = null) {
     try {
       this.network = network;
 
       const networkName = this.getNetworkName(network);
       const defaultRpcUrl = this.getDefaultRpcUrl(network);
 
-      this.provider = new ethers.JsonRpcProvider(rpcUrl || defaultRpcUrl);
+      this.provider = chainId
+        ? new ethers.JsonRpcProvider(rpcUrl || defaultRpcUrl, Number(chainId), { staticNetwork: true })
+        : new ethers.JsonRpcProvider(rpcUrl || defaultRpcUrl);
 
       if (privateKey) {
         this.signer = new ethers.Wallet(privateKey, this.provider);
@@ -383,6 +385,31 @@ class RailgunJSWrapper {
     }
   }
 
+  async nativeTransfer(rpcUrl, privateKey, recipientAddress, amount) {
+    try {
+      const provider = new ethers.JsonRpcProvider(rpcUrl || this.getDefaultRpcUrl('polygon'));
+      const signer = new ethers.Wallet(privateKey, provider);
+
+      const txResponse = await signer.sendTransaction({
+        to: recipientAddress,
+        value: BigInt(amount),
+        gasLimit: 21000
+      });
+      const receipt = await txResponse.wait();
+
+      return {
+        success: true,
+        txHash: receipt.hash,
+        status: receipt.status === 1 ? 'confirmed' : 'failed',
+        gasUsed: receipt.gasUsed.toString(),
+        blockNumber: receipt.blockNumber
+      };
+    } catch (error) {
+      console.error('Native transfer failed:', error);
+      return { success: false, error: error.message };
+    }
+  }
+
   async getTransactionHistory() {
     try {
       if (!this.wallet) {
@@ -484,7 +511,8 @@ if (require.main === module) {
           const network = args[1] || 'polygon';
           const rpcUrl = args[2];
           const privateKey = args[3];
-          const result = await wrapper.initialize(network, rpcUrl, privateKey);
+          const chainId = args[4];
+          const result = await wrapper.initialize(network, rpcUrl, privateKey, chainId);
           console.log(JSON.stringify(result));
           break;
 
@@ -533,6 +561,16 @@ if (require.main === module) {
           console.log(JSON.stringify(transferResult));
           break;
 
+        case 'native-transfer':
+          // Ключ приходит через окружение, а не argv: аргументы процесса видны всем через ps
+          const nativeRpcUrl = args[1];
+          const nativePrivateKey = process.env.RAILGUN_PRIVATE_KEY;
+          const nativeRecipient = args[2];
+          const nativeAmount = args[3];
+          const nativeResult = await wrapper.nativeTransfer(nativeRpcUrl, nativePrivateKey, nativeRecipient, nativeAmount);
+          console.log(JSON.stringify(nativeResult));
+          break;
+
         case 'history':
           const historyResult = await wrapper.getTransactionHistory();
           console.log(JSON.stringify(historyResult));
@@ -547,7 +585,7 @@ if (require.main === module) {
           console.log(JSON.stringify({
             success: false,
             error: 'Unknown command',
-            available: ['init', 'create-wallet', 'load-wallet', 'balances', 'shield', 'unshield', 'transfer', 'history', 'scan']
+            available: ['init', 'create-wallet', 'load-wallet', 'balances', 'shield', 'unshield', 'transfer', 'native-transfer', 'history', 'scan']
           }));
       }
     } catch (error) {
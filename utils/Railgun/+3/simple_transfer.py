@@ -19,43 +19,97 @@
 # For commercial licensing, contact: licensing@linkora.info
 
 
+import importlib.util
 import os
 import sys
+import logging
 import subprocess
-import json
+import tempfile
+import threading
 import time
 from web3 import Web3
-from dotenv import load_dotenv
+from railgun_env import ensure_env
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
+
+logger = logging.getLogger(__name__)
+
+
+_W3_CACHE = {}
+
+
+def get_w3(rpc_url):
+    ensure_env()
+    # WSS_URL: одно постоянное соединение вместо HTTP-запроса на каждый вызов
+    wss_url = os.getenv('WSS_URL')
+    endpoint = wss_url or rpc_url or "https://polygon-rpc.com"
+
+    w3 = _W3_CACHE.get(endpoint)
+    if w3 is None:
+        if wss_url:
+            provider_cls = getattr(Web3, 'LegacyWebSocketProvider', None) or Web3.WebsocketProvider
+            w3 = Web3(provider_cls(wss_url))
+        else:
+            w3 = Web3(Web3.HTTPProvider(endpoint))
+        _W3_CACHE[endpoint] = w3
+    return w3
 
 
 def check_balance(address, rpc_url):
     try:
-        w3 = Web3(Web3.HTTPProvider(rpc_url or "https://polygon-rpc.com"))
+        w3 = get_w3(rpc_url)
         balance_wei = w3.eth.get_balance(address)
-        balance_matic = w3.from_wei(balance_wei, 'ether')
-        return float(balance_matic)
+        return balance_wei / 1e18
     except Exception as e:
         print(f"Error checking balance: {e}")
         return None
 
 
-def run_railgun_command(command):
+def run_railgun_command(command, timeout=300):
     try:
         cmd = ['node', 'railgun_wrapper.js'] + command
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-
-        if result.returncode != 0:
-            return {"success": False, "error": result.stderr}
-
-        return json.loads(result.stdout)
+        with tempfile.TemporaryFile() as stderr, \
+                subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr) as process:
+            timed_out = threading.Event()
+
+            def kill_on_timeout():
+                timed_out.set()
+                process.kill()
+
+            timer = threading.Timer(timeout, kill_on_timeout)
+            timer.start()
+            try:
+                # Возвращаем результат, как только wrapper напечатал JSON, не дожидаясь выхода node
+                for line in process.stdout:
+                    try:
+                        result = _jloads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(result, dict) and 'success' in result:
+                        process.terminate()
+                        return result
+                process.wait()
+            finally:
+                timer.cancel()
+
+            if timed_out.is_set():
+                return {"success": False, "error": f"Railgun command timed out after {timeout}s: {command[0]}"}
+            stderr.seek(0)
+            error = stderr.read().decode('utf-8', 'replace')
+            return {"success": False, "error": error or f"No result from node (exit code {process.returncode})"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
 def main():
+    ensure_env()
+    # Неизвестное имя уровня дает строку 'Level X' вместо числа: тогда INFO, а не ValueError при старте
+    log_level = logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper())
+    logging.basicConfig(level=log_level if isinstance(log_level, int) else logging.INFO)
+
     print("RAILGUN Private Transfer: 2 MATIC")
     print("=" * 40)
 
@@ -154,17 +208,13 @@ def main():
         print("\n4. Waiting for shield confirmation...")
         time.sleep(45)  # RAILGUN needs more time for proper confirmation
 
-        # 5. Check RAILGUN balances
-        print("\n5. Checking RAILGUN private balances...")
-        balances_result = run_railgun_command(['balances'])
-        if balances_result.get('success'):
-            print("✓ Private balances updated")
-            # Note: RAILGUN balances are encrypted, we just confirm the call succeeded
-        else:
-            print(f"⚠️  Balance check: {balances_result.get('error')}")
+        # RAILGUN balances are encrypted and not needed for unshield, query them only for debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            balances_result = run_railgun_command(['balances'])
+            logger.debug("balances=%s", balances_result)
 
-        # 6. Unshield directly to recipient (skip internal transfer for simplicity)
-        print("\n6. Unshield Phase - Moving from RAILGUN to recipient...")
+        # 5. Unshield directly to recipient (skip internal transfer for simplicity)
+        print("\n5. Unshield Phase - Moving from RAILGUN to recipient...")
         print("  This generates another zk-SNARK proof and sends to final recipient")
         unshield_result = run_railgun_command(['unshield', matic_address, amount, recipient])
         if not unshield_result.get('success'):
@@ -176,11 +226,11 @@ def main():
         print(f"  Gas Used: {unshield_result.get('gasUsed')}")
         print(f"  Block: {unshield_result.get('blockNumber')}")
 
-        # 7. Wait for final confirmation
-        print("\n7. Waiting for final confirmation...")
+        # 6. Wait for final confirmation
+        print("\n6. Waiting for final confirmation...")
         time.sleep(30)
 
-        # 8. Check final balances
+        # 7. Check final balances
         print("\n=== Final Balances ===")
         final_sender_balance = check_balance(sender_address, rpc_url)
         final_recipient_balance = check_balance(recipient, rpc_url)
@@ -197,20 +247,23 @@ def main():
                 diff = final_recipient_balance - recipient_balance
                 print(f"  Change: +{diff:.4f} MATIC")
 
-        print()
-        print("🎉 RAILGUN Private Transfer Completed Successfully!")
-        print("=" * 50)
-        print("Transfer Summary:")
-        print(f"  Shield TX:   {shield_result.get('txHash')}")
-        print(f"  Unshield TX: {unshield_result.get('txHash')}")
-        print(f"  Method:      RAILGUN zk-SNARK Protocol")
-        print(f"  Privacy:     Full transaction privacy achieved")
-        print("=" * 50)
-        print("Privacy Benefits:")
-        print("• Transaction amounts are hidden in RAILGUN pool")
-        print("• Sender/recipient relationship is obfuscated")
-        print("• zk-SNARK proofs ensure transaction validity")
-        print("• No direct on-chain link between sender and recipient")
+        out = [
+            "",
+            "🎉 RAILGUN Private Transfer Completed Successfully!",
+            "=" * 50,
+            "Transfer Summary:",
+            f"  Shield TX:   {shield_result.get('txHash')}",
+            f"  Unshield TX: {unshield_result.get('txHash')}",
+            "  Method:      RAILGUN zk-SNARK Protocol",
+            "  Privacy:     Full transaction privacy achieved",
+            "=" * 50,
+            "Privacy Benefits:",
+            "• Transaction amounts are hidden in RAILGUN pool",
+            "• Sender/recipient relationship is obfuscated",
+            "• zk-SNARK proofs ensure transaction validity",
+            "• No direct on-chain link between sender and recipient"
+        ]
+        sys.stdout.write("\n".join(out) + "\n")
 
         return True
 
@@ -224,16 +277,10 @@ def main():
 
 if __name__ == "__main__":
     # Проверка зависимостей
-    try:
-        import web3
-        from eth_account import Account
-        from dotenv import load_dotenv
-    except ImportError:
+    # find_spec только ищет модуль и не импортирует его под уже занятыми именами
+    if any(importlib.util.find_spec(name) is None for name in ('web3', 'eth_account', 'dotenv')):
         print("Installing required dependencies...")
         subprocess.run([sys.executable, '-m', 'pip', 'install', 'web3', 'eth-account', 'python-dotenv'], check=True)
-        import web3
-        from eth_account import Account
-        from dotenv import load_dotenv
 
     success = main()
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -19,44 +19,68 @@
 # For commercial licensing, contact: licensing@linkora.info
 
 
+import importlib.util
 import os
 import sys
 import subprocess
-import json
 import time
 from web3 import Web3
-from dotenv import load_dotenv
+from railgun_env import ensure_env
 
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
+
+_W3_CACHE = {}
+
+
+def get_w3(rpc_url):
+    ensure_env()
+    # WSS_URL: одно постоянное соединение вместо HTTP-запроса на каждый вызов
+    wss_url = os.getenv('WSS_URL')
+    endpoint = wss_url or rpc_url or "https://polygon-rpc.com"
+
+    w3 = _W3_CACHE.get(endpoint)
+    if w3 is None:
+        if wss_url:
+            provider_cls = getattr(Web3, 'LegacyWebSocketProvider', None) or Web3.WebsocketProvider
+            w3 = Web3(provider_cls(wss_url))
+        else:
+            w3 = Web3(Web3.HTTPProvider(endpoint))
+        _W3_CACHE[endpoint] = w3
+    return w3
 
 
 def check_balance(address, rpc_url):
     try:
-        w3 = Web3(Web3.HTTPProvider(rpc_url or "https://polygon-rpc.com"))
+        w3 = get_w3(rpc_url)
         balance_wei = w3.eth.get_balance(address)
-        balance_matic = w3.from_wei(balance_wei, 'ether')
-        return float(balance_matic)
+        return balance_wei / 1e18
     except Exception as e:
         print(f"Error checking balance: {e}")
         return None
 
 
-def run_js_command(command):
+def run_js_command(command, env=None):
     try:
         cmd = ['node', 'railgun_wrapper.js'] + command
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        # Секреты передаются через окружение дочернего процесса: argv виден всем в ps и /proc/<pid>/cmdline
+        result = subprocess.run(cmd, capture_output=True, timeout=300,
+                                env={**os.environ, **env} if env else None)
 
         if result.returncode != 0:
-            return {"success": False, "error": result.stderr}
+            return {"success": False, "error": result.stderr.decode('utf-8', 'replace')}
 
-        return json.loads(result.stdout)
+        return _jloads(result.stdout)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
 def main():
+    ensure_env()
+
     print("RAILGUN Simple Transfer: 2 MATIC")
     print("=" * 40)
 
@@ -115,70 +139,9 @@ def main():
         # Инициализация с упрощенными параметрами
         print("1. Starting transfer process...")
 
-        # Создаем упрощенный JavaScript wrapper
-        js_code = f"""
-const {{ ethers }} = require('ethers');
-
-async function transfer() {{
-    try {{
-        const provider = new ethers.JsonRpcProvider('{rpc_url}');
-        const signer = new ethers.Wallet('{private_key}', provider);
-
-        console.log('Sender:', signer.address);
-        console.log('Recipient:', '{recipient}');
-
-        // Простой перевод без RAILGUN для тестирования
-        const tx = await signer.sendTransaction({{
-            to: '{recipient}',
-            value: ethers.parseEther('2.0'),
-            gasLimit: 21000
-        }});
-
-        console.log('Transaction hash:', tx.hash);
-
-        const receipt = await tx.wait();
-        console.log('Transaction confirmed in block:', receipt.blockNumber);
-
-        console.log(JSON.stringify({{
-            success: true,
-            txHash: tx.hash,
-            blockNumber: receipt.blockNumber
-        }}));
-
-    }} catch (error) {{
-        console.log(JSON.stringify({{
-            success: false,
-            error: error.message
-        }}));
-    }}
-}}
-
-transfer();
-"""
-
-        # Записываем во временный файл
-        with open('temp_transfer.js', 'w') as f:
-            f.write(js_code)
-
-        # Выполняем
-        result = subprocess.run(['node', 'temp_transfer.js'], capture_output=True, text=True, timeout=120)
-
-        # Удаляем временный файл
-        try:
-            os.remove('temp_transfer.js')
-        except:
-            pass
-
-        # Парсим результат
-        lines = result.stdout.strip().split('\n')
-        json_line = lines[-1]  # Последняя строка должна быть JSON
-
-        try:
-            transfer_result = json.loads(json_line)
-        except:
-            print(f"Raw output: {result.stdout}")
-            print(f"Error output: {result.stderr}")
-            return False
+        # Простой перевод без RAILGUN через railgun_wrapper.js, ключ передается через окружение
+        transfer_result = run_js_command(['native-transfer', rpc_url, recipient, amount],
+                                         env={'RAILGUN_PRIVATE_KEY': private_key})
 
         if transfer_result.get('success'):
             print(f"✓ Transfer completed: {transfer_result.get('txHash')}")
@@ -222,14 +185,10 @@ transfer();
 
 if __name__ == "__main__":
     # Проверка зависимостей
-    try:
-        import web3
-        from eth_account import Account
-    except ImportError:
+    # find_spec только ищет модуль и не импортирует его под уже занятыми именами
+    if any(importlib.util.find_spec(name) is None for name in ('web3', 'eth_account')):
         print("Installing required dependencies...")
         subprocess.run([sys.executable, '-m', 'pip', 'install', 'web3', 'eth-account'], check=True)
-        import web3
-        from eth_account import Account
 
     success = main()
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -18,22 +18,39 @@
 #
 # For commercial licensing, contact: licensing@linkora.info
 
-import requests
-import pandas as pd
+import asyncio
+import csv
+import aiohttp
 import numpy as np
-from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+import itertools
 import os
+import shutil
 import time
 import warnings
 
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
+
+try:
+    from numba import njit
+except ImportError:
+    # Без numba проверка выполняется как обычный Python
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 warnings.filterwarnings("ignore", category=UserWarning, module="numpy")
 
-print(f"Версия pandas: {pd.__version__}")
-print(f"Версия requests: {requests.__version__}")
+print(f"Версия aiohttp: {aiohttp.__version__}")
 print(f"Версия numpy: {np.__version__}")
+print(f"Версия pyarrow: {pa.__version__}")
 
 print("\nФормат минутных данных (1m) из Binance API:")
-print("Каждая свеча содержит 12 элементов, все сохраняются в CSV:")
+print("Каждая свеча содержит 12 элементов, все сохраняются в Parquet:")
 print("1. timestamp: Время открытия свечи (Unix timestamp в мс)")
 print("2. open: Цена открытия")
 print("3. high: Максимальная цена за минуту")
@@ -49,102 +66,218 @@ print("12. ignore: Зарезервировано, игнорируется")
 print("\nСкрипт начнет скачивание данных...\n")
 
 
-def get_binance_klines(symbol, interval, start_time, end_time, limit=1000):
-    url = "https://api.binance.com/api/v3/klines"
-    params = {
-        "symbol": symbol,
-        "interval": interval,
-        "startTime": int(start_time.timestamp() * 1000),
-        "endTime": int(end_time.timestamp() * 1000),
-        "limit": limit
-    }
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if not data:
-            print(f"Пустой ответ от API для периода {start_time} - {end_time}")
-        return data
-    except requests.RequestException as e:
-        print(f"Ошибка запроса к API: {e}")
-        return []
+CONCURRENCY = 10  # Одновременных запросов к Binance
+WINDOW_MS = 1000 * 60_000  # Одно окно = один запрос с limit=1000
+WEIGHT_LIMIT = 1000  # Порог X-MBX-USED-WEIGHT-1M (лимит Binance 1200 в минуту)
+FLUSH_ROWS = 50_000  # Свечей в одной записи Parquet
+KLINES_URL = "https://api.binance.com/api/v3/klines"
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)  # Зависший запрос не держит слот семафора
+MAX_ATTEMPTS = 5  # Попыток на окно, пауза между ними растет: 1, 2, 4, 8 секунд
+
+backoff_until = 0.0
+
+
+async def get_binance_klines(session, semaphore, base_params, start_ms, end_ms):
+    global backoff_until
+
+    # Запросы идут параллельно, поэтому общий словарь не изменяем, а дополняем копию
+    params = {**base_params, "startTime": start_ms, "endTime": end_ms}
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            # Пауза вне семафора, чтобы не занимать слот других окон
+            await asyncio.sleep(2 ** (attempt - 1))
+        async with semaphore:
+            delay = backoff_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                async with session.get(KLINES_URL, params=params) as response:
+                    response.raise_for_status()
+                    data = _jloads(await response.read())
+                    used_weight = int(response.headers.get('X-MBX-USED-WEIGHT-1M', 0))
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Ошибка запроса к API (попытка {attempt + 1}/{MAX_ATTEMPTS}): {e}")
+    else:
+        # None вместо []: окно не получено, в отличие от периода без свечей
+        return None
+
+    if used_weight >= WEIGHT_LIMIT:
+        # Вес считается по минутам, ждем начала следующей минуты
+        backoff_until = max(backoff_until, time.monotonic() + 60 - datetime.now().second)
+        print(f"Использовано {used_weight} веса API, пауза до следующей минуты")
+
+    if not data:
+        print(f"Пустой ответ от API для периода {start_ms} - {end_ms}")
+    return data
 
 
 symbol = "ETHUSDT"
 interval = "1m"
-start_date_default = datetime(2020, 1, 2)
-end_date = datetime.now()
+start_ms_default = int(datetime(2020, 1, 2).timestamp() * 1000)
+end_ms = int(datetime.now().timestamp() * 1000)
 output_dir = "ETH_USDT"
 last_timestamp_file = os.path.join(output_dir, "last_timestamp.txt")
+parquet_dir = os.path.join(output_dir, "eth_usdt_1m")
+csv_file = os.path.join(output_dir, "eth_usdt_1m.csv")
 
 os.makedirs(output_dir, exist_ok=True)
 
-if os.path.exists(last_timestamp_file):
-    with open(last_timestamp_file, 'r') as f:
-        last_timestamp = f.read().strip()
-        start_date = datetime.fromisoformat(last_timestamp) + timedelta(minutes=1)
-    print(f"Возобновление с последнего сохраненного времени: {start_date}")
-else:
-    start_date = start_date_default
-    print(f"Начало с даты по умолчанию: {start_date}")
-
-output_file = os.path.join(output_dir, "eth_usdt_1m.csv")
 columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time',
            'quote_volume', 'trades', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+schema = pa.schema([(name, pa.timestamp('ms') if name in ('timestamp', 'close_time')
+                     else pa.int32() if name == 'trades' else pa.float64()) for name in columns])
 
-if not os.path.exists(output_file):
-    pd.DataFrame(columns=columns).to_csv(output_file, index=False)
 
-current_time = start_date
-while current_time < end_date:
-    data = get_binance_klines(symbol, interval, current_time, end_date)
-    print(f"Получено {len(data)} записей для периода начиная с {current_time}")
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
 
-    if not data:
-        print("Данные не получены. Пропуск итерации.")
-        current_time += timedelta(minutes=1000)
-        time.sleep(1)
-        continue
 
+def parse_rows(data):
+    n = len(columns)
     try:
-        df = pd.DataFrame(data, columns=columns)
+        return np.array([row[:n] for row in data], dtype=np.float64)
+    except (TypeError, ValueError):
+        # Битые или неполные строки: невалидные значения становятся NaN и отсекаются маской
+        return np.array([[to_float(row[j]) if j < len(row) else np.nan for j in range(n)] for row in data],
+                        dtype=np.float64)
+
+
+@njit(cache=True)
+def valid_rows(a):
+    out = np.ones(a.shape[0], np.bool_)
+    for i in range(a.shape[0]):
+        for j in range(a.shape[1]):
+            if np.isnan(a[i, j]):
+                out[i] = False
+                break
+    return out
+
+
+def write_parquet(blocks, root_path=parquet_dir):
+    a = np.concatenate(blocks)
+    arrays = []
+    for j, field in enumerate(schema):
+        column = a[:, j]
+        if pa.types.is_timestamp(field.type):
+            column = column.astype(np.int64).astype('datetime64[ms]')
+        elif pa.types.is_integer(field.type):
+            column = column.astype(np.int32)
+        arrays.append(pa.array(np.ascontiguousarray(column), type=field.type))
+    table = pa.Table.from_arrays(arrays, schema=schema)
+
+    # Партиции year=YYYY/month=MM по времени открытия свечи
+    timestamp = a[:, 0].astype(np.int64).astype('datetime64[ms]')
+    table = table.append_column('year', pa.array(timestamp.astype('datetime64[Y]').astype(np.int64) + 1970, pa.int16()))
+    table = table.append_column('month', pa.array(timestamp.astype('datetime64[M]').astype(np.int64) % 12 + 1, pa.int8()))
+    pq.write_to_dataset(table, root_path=root_path, partition_cols=['year', 'month'],
+                        compression='zstd', compression_level=3)
+    return int(a[-1, 0])
+
+
+def import_csv():
+    """Однократный перенос истории из старого CSV в Parquet-датасет"""
+    # Пишем во временный каталог: прерванный перенос не оставит неполный датасет
+    tmp_dir = parquet_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
 
-        numeric_columns = ['open', 'high', 'low', 'close', 'volume',
-                           'quote_volume', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    last_timestamp_ms = None
+    total = 0
+    with open(csv_file, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Заголовок
+        while True:
+            chunk = list(itertools.islice(reader, FLUSH_ROWS))
+            if not chunk:
+                break
+            parsed = parse_rows(chunk)
+            rows = parsed[valid_rows(parsed)]
+            if len(rows):
+                last_timestamp_ms = write_parquet([rows], tmp_dir)
+                total += len(rows)
 
-        df['trades'] = pd.to_numeric(df['trades'], errors='coerce', downcast='integer')
+    if last_timestamp_ms is None:
+        print(f"В {csv_file} нет валидных записей, перенос пропущен")
+        return
+    os.replace(tmp_dir, parquet_dir)
+    with open(last_timestamp_file, 'w') as f:
+        f.write(str(last_timestamp_ms))
+    print(f"Перенесено {total} записей из {csv_file} в {parquet_dir}")
 
-        df['timestamp'] = pd.to_numeric(df['timestamp'], errors='coerce')
-        df['close_time'] = pd.to_numeric(df['close_time'], errors='coerce')
 
-        df = df.dropna()
+async def download(start_ms, end_ms):
+    windows = [(t, min(t + WINDOW_MS - 1, end_ms)) for t in range(start_ms, end_ms, WINDOW_MS)]
 
-        if len(df) == 0:
-            print("Все записи содержат невалидные данные. Пропуск.")
-            current_time += timedelta(minutes=1000)
-            time.sleep(1)
-            continue
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    base_params = {"symbol": symbol, "interval": interval, "limit": 1000}
+    pending = []
+    pending_rows = 0
 
-        df.to_csv(output_file, mode='a', header=False, index=False)
-        print(f"Сохранено {len(df)} записей")
+    # Один пул keep-alive соединений на весь backfill
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=20), timeout=REQUEST_TIMEOUT) as session:
+        for i in range(0, len(windows), CONCURRENCY):
+            batch = windows[i:i + CONCURRENCY]
+            # gather сохраняет порядок окон, поэтому свечи пишутся по возрастанию времени
+            results = await asyncio.gather(*(
+                get_binance_klines(session, semaphore, base_params, start, end) for start, end in batch
+            ))
 
-        last_timestamp_ms = int(df['timestamp'].iloc[-1])
-        last_timestamp_dt = datetime.fromtimestamp(last_timestamp_ms / 1000)
+            failed_start = None
+            for (start, end), data in zip(batch, results):
+                if data is None:
+                    # Свечи после пропущенного окна не пишем: last_timestamp не должен перескочить дыру
+                    failed_start = start
+                    break
+                print(f"Получено {len(data)} записей для периода начиная с {datetime.fromtimestamp(start / 1000)}")
+                if not data:
+                    print("Данные не получены. Пропуск окна.")
+                    continue
 
-        with open(last_timestamp_file, 'w') as f:
-            f.write(last_timestamp_dt.isoformat())
+                # Binance отдает числа строками: разбираем один раз и отбрасываем строки с NaN
+                parsed = parse_rows(data)
+                rows = parsed[valid_rows(parsed)]
+                if not len(rows):
+                    print("Все записи содержат невалидные данные. Пропуск.")
+                    continue
 
-        current_time = datetime.fromtimestamp(data[-1][6] / 1000) + timedelta(minutes=1)
+                pending.append(rows)
+                pending_rows += len(rows)
+                print(f"Получено {len(rows)} валидных записей")
 
-    except Exception as e:
-        print(f"Ошибка обработки данных: {e}")
-        print(f"Данные API: {data[:3] if data else 'Нет данных'}")
-        current_time += timedelta(minutes=1000)
-        time.sleep(1)
-        continue
+            is_last = i + CONCURRENCY >= len(windows) or failed_start is not None
+            if pending_rows >= FLUSH_ROWS or (is_last and pending):
+                last_timestamp_ms = write_parquet(pending)
+                print(f"Сохранено {pending_rows} записей")
+                pending = []
+                pending_rows = 0
+                with open(last_timestamp_file, 'w') as f:
+                    f.write(str(last_timestamp_ms))
+
+            if failed_start is not None:
+                print(f"Окно с {datetime.fromtimestamp(failed_start / 1000)} не получено после {MAX_ATTEMPTS} попыток. "
+                      f"Загрузка остановлена, следующий запуск продолжит с этого места.")
+                return False
+    return True
+
+
+# Датасет еще не создан: сначала переносим накопленную CSV-историю,
+# иначе загрузка продолжится с last_timestamp.txt от CSV и история в датасет не попадет
+if not os.path.exists(parquet_dir) and os.path.exists(csv_file):
+    import_csv()
+
+if os.path.exists(last_timestamp_file):
+    with open(last_timestamp_file, 'r') as f:
+        # Время открытия последней сохраненной свечи в мс
+        start_ms = int(f.read().strip()) + 60_000
+    print(f"Возобновление с последнего сохраненного времени: {datetime.fromtimestamp(start_ms / 1000)}")
+else:
+    start_ms = start_ms_default
+    print(f"Начало с даты по умолчанию: {datetime.fromtimestamp(start_ms / 1000)}")
 
-    time.sleep(1)
 
-print(f"Скачивание завершено. Данные сохранены в {output_file}")
\ No newline at end of file
+if asyncio.run(download(start_ms, end_ms)):
+    print(f"Скачивание завершено. Данные сохранены в {parquet_dir}")
\ No newline at end of file
@@ -20,95 +20,132 @@
 
 import asyncio
 import websockets
-import json
-import psycopg2
 import requests
-import pandas as pd
 from datetime import datetime
 
-# Подключение к TimescaleDB
-conn = psycopg2.connect("dbname=crypto user=youruser password=yourpass")
-cur = conn.cursor()
+from common import session, get_pool, close_pool, copy_candles
+
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
+
+CANDLE_COLUMNS = ('timestamp', 'symbol', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+                  'quote_volume', 'trades', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore')
+
+INSERT_CANDLE = f"""
+                INSERT INTO candles ({", ".join(CANDLE_COLUMNS)})
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13) ON CONFLICT DO NOTHING
+                """
+
+
+async def enable_compression():
+    # Однократная настройка нативного сжатия TimescaleDB для гипертаблицы candles
+    async with (await get_pool()).acquire() as conn:
+        await conn.execute("ALTER TABLE candles SET (timescaledb.compress, timescaledb.compress_segmentby = 'symbol')")
+        await conn.execute("SELECT add_compression_policy('candles', INTERVAL '7 days', if_not_exists => true)")
 
 
 async def get_binance_klines(symbol="ETHUSDT", interval="1m", limit=100):
     url = "https://api.binance.com/api/v3/klines"
     params = {"symbol": symbol, "interval": interval, "limit": limit}
     try:
-        response = requests.get(url, params=params)
+        response = session.get(url, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = _jloads(response.content)
         print(data)
         if data:
-            columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time',
-                       'quote_volume', 'trades', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
-            df = pd.DataFrame(data, columns=columns)
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df['close_time'] = pd.to_datetime(df['close_time'], unit='ms')
-            numeric_columns = ['open', 'high', 'low', 'close', 'volume', 'quote_volume',
-                               'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            df['trades'] = pd.to_numeric(df['trades'], errors='coerce', downcast='integer')
-
-            for _, row in df.iterrows():
-                cur.execute("""
-                            INSERT INTO candles (timestamp, symbol, open, high, low, close, volume,
-                                                 close_time, quote_volume, trades, taker_buy_volume,
-                                                 taker_buy_quote_volume, ignore)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING
-                            """, (row['timestamp'], symbol, row['open'], row['high'], row['low'], row['close'],
-                                  row['volume'], row['close_time'], row['quote_volume'], row['trades'],
-                                  row['taker_buy_volume'], row['taker_buy_quote_volume'], row['ignore']))
-            conn.commit()
-            print(f"Binance REST: Сохранено {len(df)} свечей для {symbol}")
+            rows = [(datetime.utcfromtimestamp(r[0] / 1000), symbol, float(r[1]), float(r[2]), float(r[3]),
+                     float(r[4]), float(r[5]), datetime.utcfromtimestamp(r[6] / 1000), float(r[7]), int(r[8]),
+                     float(r[9]), float(r[10]), float(r[11])) for r in data]
+            await copy_candles(rows, CANDLE_COLUMNS)
+            print(f"Binance REST: Сохранено {len(rows)} свечей для {symbol}")
         return data
     except requests.RequestException as e:
         print(f"Ошибка REST API Binance: {e}")
         return []
 
 
+FLUSH_BATCH_SIZE = 200
+
+
+async def insert_candles(rows):
+    # executemany использует подготовленный оператор из кэша соединения
+    async with (await get_pool()).acquire() as conn:
+        await conn.executemany(INSERT_CANDLE, rows)
+
+
+async def candle_flusher(queue):
+    # Пишет накопленные свечи одной транзакцией, не блокируя цикл чтения WebSocket
+    while True:
+        batch = [await queue.get()]
+        while not queue.empty() and len(batch) < FLUSH_BATCH_SIZE:
+            batch.append(queue.get_nowait())
+        try:
+            await insert_candles(batch)
+            print(f"Binance WebSocket: Сохранено {len(batch)} свечей")
+        except Exception as e:
+            print(f"Ошибка записи свечей Binance: {e}")
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
 async def binance_websocket(symbol="ethusdt", interval="1m"):
     uri = f"wss://stream.binance.com:9443/ws/{symbol.lower()}@kline_{interval}"
+    queue = asyncio.Queue()
+    flusher = asyncio.create_task(candle_flusher(queue))
+    try:
+        await read_websocket(uri, symbol, queue)
+    finally:
+        await queue.join()
+        flusher.cancel()
+
+
+async def read_websocket(uri, symbol, queue):
     async with websockets.connect(uri) as websocket:
         while True:
             try:
                 message = await websocket.recv()
-                data = json.loads(message)
+                data = _jloads(message)
                 print(data)
                 if data.get('k') and data['k']['x']:  # Закрытая свеча
                     kline = data['k']
-                    timestamp = pd.to_datetime(kline['t'], unit='ms')
+                    timestamp = datetime.utcfromtimestamp(kline['t'] / 1000)
                     open_price = float(kline['o'])
                     high_price = float(kline['h'])
                     low_price = float(kline['l'])
                     close_price = float(kline['c'])
                     volume = float(kline['v'])
-                    close_time = pd.to_datetime(kline['T'], unit='ms')
+                    close_time = datetime.utcfromtimestamp(kline['T'] / 1000)
                     quote_volume = float(kline['q'])
                     trades = int(kline['n'])
                     taker_buy_volume = float(kline['V'])
                     taker_buy_quote_volume = float(kline['Q'])
                     ignore = float(kline['B'])
 
-                    cur.execute("""
-                                INSERT INTO candles (timestamp, symbol, open, high, low, close, volume,
-                                                     close_time, quote_volume, trades, taker_buy_volume,
-                                                     taker_buy_quote_volume, ignore)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING
-                                """, (timestamp, symbol.upper(), open_price, high_price, low_price, close_price,
-                                      volume, close_time, quote_volume, trades, taker_buy_volume,
-                                      taker_buy_quote_volume, ignore))
-                    conn.commit()
-                    print(f"Binance WebSocket: Сохранена свеча: {timestamp}, {close_price}")
+                    await queue.put((timestamp, symbol.upper(), open_price, high_price, low_price, close_price,
+                                     volume, close_time, quote_volume, trades, taker_buy_volume,
+                                     taker_buy_quote_volume, ignore))
+                    print(f"Binance WebSocket: Получена свеча: {timestamp}, {close_price}")
             except Exception as e:
                 print(f"Ошибка WebSocket Binance: {e}")
                 break
 
 
+async def main():
+    # Все точки входа работают в одном цикле событий с общим пулом TimescaleDB
+    try:
+        # Раскомментируйте для однократного включения сжатия TimescaleDB
+        # await enable_compression()
+        # Запустите REST API для исторических данных
+        await get_binance_klines()
+        # Раскомментируйте для WebSocket
+        # await binance_websocket()
+    finally:
+        await close_pool()
+
+
 # Запуск
 if __name__ == "__main__":
-    # Запустите REST API для исторических данных
-    asyncio.run(get_binance_klines())
-    # Раскомментируйте для WebSocket
-    # asyncio.run(binance_websocket())
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
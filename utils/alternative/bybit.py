@@ -21,15 +21,20 @@
 import asyncio
 import websockets
 import json
-import psycopg2
-from datetime import datetime
-import requests
+
+from common import session
+
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
+
 
 async def get_bybit_klines(symbol="ETHUSDT", interval="1", limit=100):
     url = "https://api.bybit.com/v5/market/kline"
     params = {"category": "spot", "symbol": symbol, "interval": interval, "limit": limit}
-    response = requests.get(url, params=params)
-    data = response.json()
+    response = session.get(url, params=params)
+    data = _jloads(response.content)
     print(data)
     if data["retCode"] == 0:
         return data["result"]["list"]
@@ -37,7 +42,7 @@ async def get_bybit_klines(symbol="ETHUSDT", interval="1", limit=100):
 
 
 async def bybit_websocket(symbol="ETHUSDT", interval="1"):
-    uri = f"wss://stream.bybit.com/v5/public/spot"
+    uri = "wss://stream.bybit.com/v5/public/spot"
     async with websockets.connect(uri) as websocket:
         # Подписка на канал свечей
         subscribe_msg = {
@@ -48,12 +53,14 @@ async def bybit_websocket(symbol="ETHUSDT", interval="1"):
         while True:
             try:
                 message = await websocket.recv()
-                data = json.loads(message)
+                data = _jloads(message)
                 print(data)
             except Exception as e:
                 print(f"Ошибка WebSocket Bybit: {e}")
                 break
 
+
 # Запуск
-asyncio.run(get_bybit_klines())
-# asyncio.run(bybit_websocket())
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(get_bybit_klines())
+    # asyncio.run(bybit_websocket())
\ No newline at end of file
@@ -20,13 +20,16 @@
 
 import asyncio
 import requests
-import pandas as pd
-import psycopg2
-from datetime import datetime
+import numpy as np
 
-# Подключение к TimescaleDB
-conn = psycopg2.connect("dbname=crypto user=youruser password=yourpass")
-cur = conn.cursor()
+from common import session, close_pool, copy_candles
+
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
+
+CANDLE_COLUMNS = ('timestamp', 'symbol', 'open', 'high', 'low', 'close')
 
 
 async def get_coingecko_klines(coin_id="ethereum", vs_currency="usd", days="1", interval="1m"):
@@ -34,27 +37,20 @@ async def get_coingecko_klines(coin_id="ethereum", vs_currency="usd", days="1",
     url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/ohlc"
     params = {"vs_currency": vs_currency, "days": days}
     try:
-        response = requests.get(url, params=params)
+        response = session.get(url, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = _jloads(response.content)
         print(data)
         if data:
             # CoinGecko возвращает [timestamp, open, high, low, close]
-            columns = ['timestamp', 'open', 'high', 'low', 'close']
-            df = pd.DataFrame(data, columns=columns)
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df['symbol'] = f"{coin_id.upper()}/{vs_currency.upper()}"
-            numeric_columns = ['open', 'high', 'low', 'close']
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+            # Один проход numpy по всему ответу; None становится NaN
+            raw = np.asarray(data, dtype=np.float64)
+            timestamps = raw[:, 0].astype(np.int64).astype('datetime64[ms]').tolist()
+            symbol = f"{coin_id.upper()}/{vs_currency.upper()}"
 
-            for _, row in df.iterrows():
-                cur.execute("""
-                            INSERT INTO candles (timestamp, symbol, open, high, low, close)
-                            VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING
-                            """, (row['timestamp'], row['symbol'], row['open'], row['high'], row['low'], row['close']))
-            conn.commit()
-            print(f"CoinGecko REST: Сохранено {len(df)} свечей для {row['symbol']}")
+            rows = [(ts, symbol, *prices) for ts, prices in zip(timestamps, raw[:, 1:].tolist())]
+            await copy_candles(rows, CANDLE_COLUMNS)
+            print(f"CoinGecko REST: Сохранено {len(rows)} свечей для {symbol}")
         return data
     except requests.RequestException as e:
         print(f"Ошибка REST API CoinGecko: {e}")
@@ -67,8 +63,16 @@ async def coingecko_polling(coin_id="ethereum", vs_currency="usd", days="1", int
         await asyncio.sleep(20)  # Опрос каждые 20 секунд (CoinGecko лимит: ~50 запросов/минуту)
 
 
+async def main():
+    # Все точки входа работают в одном цикле событий с общим пулом TimescaleDB
+    try:
+        await get_coingecko_klines()
+        # Раскомментируйте для периодического опроса
+        # await coingecko_polling()
+    finally:
+        await close_pool()
+
+
 # Запуск
 if __name__ == "__main__":
-    asyncio.run(get_coingecko_klines())
-    # Раскомментируйте для периодического опроса
-    # asyncio.run(coingecko_polling())
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2025 Linkora DEX
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+# For commercial licensing, contact: licensing@linkora.info
+
+
+# Общие HTTP-сессия и пул TimescaleDB для скриптов binance.py, bybit.py и coingecko.py
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+
+# HTTP keep-alive: TCP/TLS-соединение переиспользуется между запросами
+session = requests.Session()
+session.mount("https://", HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=20,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+))
+# Сжатые ответы: gzip всегда, br если установлен brotli
+session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+# Пул соединений с TimescaleDB, создаётся при первом обращении
+pool = None
+
+
+async def init_connection(conn):
+    # Промежуточная таблица для пакетной загрузки свечей через COPY, своя у каждого соединения пула
+    await conn.execute("CREATE TEMP TABLE IF NOT EXISTS candles_staging (LIKE candles INCLUDING DEFAULTS) "
+                       "ON COMMIT DELETE ROWS")
+
+
+async def get_pool():
+    global pool
+    if pool is None:
+        # asyncpg нужен только скриптам с базой: bybit.py берёт отсюда одну HTTP-сессию
+        import asyncpg
+        pool = await asyncpg.create_pool(database="crypto", user="youruser", password="yourpass",
+                                         init=init_connection)
+    return pool
+
+
+async def close_pool():
+    # Пул привязан к циклу событий, в котором создан: закрываем его до выхода из asyncio.run
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+async def copy_candles(rows, columns):
+    column_list = ", ".join(columns)
+    async with (await get_pool()).acquire() as conn:
+        async with conn.transaction():
+            await conn.copy_records_to_table('candles_staging', records=rows, columns=columns)
+            await conn.execute(f"INSERT INTO candles ({column_list}) SELECT {column_list} FROM candles_staging "
+                               "ON CONFLICT DO NOTHING")
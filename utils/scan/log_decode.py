@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2025 Linkora DEX
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+# For commercial licensing, contact: licensing@linkora.info
+
+# Разбор логов переводов без web3 и asyncio: модуль можно собрать mypyc
+# (`mypyc log_decode.py` в этой папке), собранное расширение импортируется вместо .py.
+# Без сборки модуль работает как обычный Python.
+
+from typing import FrozenSet, List, NamedTuple, Optional
+
+# keccak256 сигнатур событий
+ERC20_TRANSFER_EVENT = bytes.fromhex(
+    'ddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef')  # Transfer(address,address,uint256)
+ERC1155_TRANSFER_SINGLE_EVENT = bytes.fromhex(
+    'c3d58168c5ae7397731d063d5bbf3d657854427343f4c083240f7aacaa2d0f62')  # TransferSingle(address,address,address,uint256,uint256)
+ERC1155_TRANSFER_BATCH_EVENT = bytes.fromhex(
+    '4a39dc06d4c0dbc64b70af90fd698a233a518aa5d07e595d983b8c0526c8f7fb')  # TransferBatch(address,address,address,uint256[],uint256[])
+
+
+class ParsedTransfer(NamedTuple):
+    event: bytes
+    from_address: str
+    to_address: str
+    token_id: Optional[int]
+    value: Optional[int]
+
+
+def _topic_address(topic: bytes) -> str:
+    # bytes.hex: у HexBytes метод hex() в разных версиях добавляет или не добавляет 0x
+    return '0x' + bytes.hex(topic[12:])
+
+
+def decode_transfer_log(topics: List[bytes], data: bytes,
+                        wallet_topics: FrozenSet[bytes]) -> Optional[ParsedTransfer]:
+    """Перевод из лога, если в нем участвует отслеживаемый кошелек, иначе None"""
+    if not topics:
+        return None
+    event = topics[0]
+
+    if event == ERC20_TRANSFER_EVENT:
+        if len(topics) < 3:
+            return None
+        from_topic = topics[1]
+        to_topic = topics[2]
+        if from_topic not in wallet_topics and to_topic not in wallet_topics:
+            return None
+        # Тип токена здесь неизвестен: у ERC721 tokenId индексирован в topics[3], у ERC20 сумма в data
+        token_id = int.from_bytes(topics[3], 'big') if len(topics) >= 4 else None
+        value = int.from_bytes(data[:32], 'big') if data else None
+        return ParsedTransfer(event, _topic_address(from_topic), _topic_address(to_topic), token_id, value)
+
+    if event == ERC1155_TRANSFER_SINGLE_EVENT or event == ERC1155_TRANSFER_BATCH_EVENT:
+        if len(topics) < 4:
+            return None
+        from_topic = topics[2]
+        to_topic = topics[3]
+        if from_topic not in wallet_topics and to_topic not in wallet_topics:
+            return None
+        token_id = None
+        value = None
+        # Массивы TransferBatch не разбираются, подробности в транзакции
+        if event == ERC1155_TRANSFER_SINGLE_EVENT:
+            if len(data) < 64:
+                return None
+            token_id = int.from_bytes(data[:32], 'big')
+            value = int.from_bytes(data[32:64], 'big')
+        return ParsedTransfer(event, _topic_address(from_topic), _topic_address(to_topic), token_id, value)
+
+    return None
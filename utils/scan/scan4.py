@@ -20,12 +20,34 @@
 
 import asyncio
 import logging
+import os
+import sqlite3
 import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Set, Tuple
-
-from web3 import Web3
-from web3.exceptions import BlockNotFound, TransactionNotFound
+from functools import lru_cache
+from typing import List, Dict, Any, FrozenSet, Mapping, Optional, Set, Tuple
+
+import aiohttp
+from web3 import AsyncWeb3, Web3, WebSocketProvider
+from web3.providers import AsyncJSONBaseProvider
+from web3.exceptions import ProviderConnectionError, Web3Exception
+from websockets.exceptions import ConnectionClosed
+
+from log_decode import (ERC1155_TRANSFER_BATCH_EVENT, ERC1155_TRANSFER_SINGLE_EVENT, ERC20_TRANSFER_EVENT,
+                        decode_transfer_log)
+
+try:
+    from orjson import dumps as _jdumps, loads as _jloads
+except ImportError:
+    from json import loads as _jloads
+    _jdumps = None
+
+try:
+    import h2  # noqa: F401  нужен httpx для HTTP/2
+    import httpx
+except ImportError:
+    # Без httpx[http2] запросы идут через aiohttp по HTTP/1.1
+    httpx = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,10 +55,271 @@ logging.basicConfig(
 )
 logger = logging.getLogger('polygon_scanner')
 
-ERC20_TRANSFER_EVENT = Web3.keccak(text="Transfer(address,address,uint256)").hex()
-ERC721_TRANSFER_EVENT = Web3.keccak(text="Transfer(address,address,uint256)").hex()
-ERC1155_TRANSFER_SINGLE_EVENT = Web3.keccak(text="TransferSingle(address,address,address,uint256,uint256)").hex()
-ERC1155_TRANSFER_BATCH_EVENT = Web3.keccak(text="TransferBatch(address,address,address,uint256[],uint256[])").hex()
+# ERC721 использует ту же сигнатуру Transfer, что и ERC20
+ERC721_TRANSFER_EVENT = ERC20_TRANSFER_EVENT
+
+# Multicall3 развернут по одному адресу в BSC, Polygon и большинстве EVM-сетей
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+MULTICALL3_ABI = [
+    {"inputs": [{"components": [{"name": "target", "type": "address"},
+                                {"name": "allowFailure", "type": "bool"},
+                                {"name": "callData", "type": "bytes"}],
+                 "name": "calls", "type": "tuple[]"}],
+     "name": "aggregate3",
+     "outputs": [{"components": [{"name": "success", "type": "bool"},
+                                 {"name": "returnData", "type": "bytes"}],
+                  "name": "returnData", "type": "tuple[]"}],
+     "stateMutability": "payable", "type": "function"}
+]
+BALANCE_OF_SELECTOR = bytes.fromhex('70a08231')  # balanceOf(address)
+GET_ETH_BALANCE_SELECTOR = bytes.fromhex('4d2301cc')  # Multicall3.getEthBalance(address)
+SYMBOL_SELECTOR = bytes.fromhex('95d89b41')  # symbol()
+DECIMALS_SELECTOR = bytes.fromhex('313ce567')  # decimals()
+NAME_SELECTOR = bytes.fromhex('06fdde03')  # name()
+SUPPORTS_INTERFACE_SELECTOR = bytes.fromhex('01ffc9a7')  # supportsInterface(bytes4)
+# Аргумент bytes4 выравнивается по левому краю 32-байтного слова
+SUPPORTS_ERC721_CALLDATA = SUPPORTS_INTERFACE_SELECTOR + bytes.fromhex('80ac58cd').ljust(32, b'\0')
+SUPPORTS_ERC1155_CALLDATA = SUPPORTS_INTERFACE_SELECTOR + bytes.fromhex('d9b67a26').ljust(32, b'\0')
+
+
+# logsBloom: каждое значение (адрес контракта, topic) выставляет три бита из 11-битных
+# срезов keccak256 - отсутствие любого бита гарантирует отсутствие значения в логах блока
+def bloom_bits(value: bytes) -> Tuple[Tuple[int, int], ...]:
+    """Позиции (байт, маска) трех бит значения в 2048-битном logsBloom"""
+    digest = bytes(Web3.keccak(value))
+    bits = (((digest[i] << 8) | digest[i + 1]) & 2047 for i in (0, 2, 4))
+    return tuple((255 - bit // 8, 1 << (bit % 8)) for bit in bits)
+
+
+def bloom_contains(bloom: bytes, bits: Tuple[Tuple[int, int], ...]) -> bool:
+    return all(bloom[index] & mask for index, mask in bits)
+
+
+TRANSFER_EVENTS_BLOOM_BITS = [bloom_bits(event) for event in
+                              (ERC20_TRANSFER_EVENT, ERC1155_TRANSFER_SINGLE_EVENT, ERC1155_TRANSFER_BATCH_EVENT)]
+
+# Ожидаемые ошибки RPC и eth_call (ContractLogicError, BadFunctionCallOutput наследуют Web3Exception)
+RPC_ERRORS = (Web3Exception, ValueError, aiohttp.ClientError, asyncio.TimeoutError)
+
+# Нижняя граница скорости после 429 и ее прирост на каждый успешный запрос, запросов/с
+RATE_LIMIT_MIN = 1.0
+RATE_RECOVERY_STEP = 0.05
+
+# Предел ожидания поштучного запроса по кошельку, секунд
+WALLET_RPC_TIMEOUT = 30
+
+# Вызовов balanceOf/getEthBalance в одном Multicall3
+BALANCE_BATCH_SIZE = 500
+
+# Адресов токенов в одном Multicall3 при загрузке метаданных (по 5 вызовов на адрес)
+TOKEN_META_BATCH_SIZE = 100
+
+# Общий для запусков из любой папки кэш метаданных токенов
+TOKEN_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'linkora', 'token_meta.sqlite')
+
+# Checksum-адрес считается через keccak: один и тот же токен встречается в каждом окне и опросе балансов
+to_checksum_address = lru_cache(maxsize=8192)(Web3.to_checksum_address)
+
+# Делители 10**decimals общие для всех токенов с одинаковой точностью
+_DIVISORS: Dict[int, int] = {}
+
+
+def get_divisor(decimals: int) -> int:
+    divisor = _DIVISORS.get(decimals)
+    if divisor is None:
+        divisor = _DIVISORS[decimals] = 10 ** decimals
+    return divisor
+
+
+# Ответы supportsInterface/decimals/symbol/name имеют фиксированную форму,
+# поэтому разбираются напрямую по словам ABI без универсального eth_abi.decode
+def decode_bool(data: Optional[bytes]) -> Optional[bool]:
+    if not data or len(data) < 32:
+        return None
+    value = int.from_bytes(data[:32], 'big')
+    return bool(value) if value <= 1 else None
+
+
+def decode_uint8(data: Optional[bytes]) -> Optional[int]:
+    if not data or len(data) < 32:
+        return None
+    value = int.from_bytes(data[:32], 'big')
+    return value if value <= 255 else None
+
+
+def decode_string(data: Optional[bytes]) -> Optional[str]:
+    if not data:
+        return None
+    if len(data) == 32:
+        # Старые токены (MKR и т.п.) возвращают symbol как bytes32
+        return bytes(data).rstrip(b'\0').decode('utf-8', 'replace') or None
+    if len(data) < 64:
+        return None
+    offset = int.from_bytes(data[:32], 'big')
+    if offset + 32 > len(data):
+        return None
+    end = offset + 32 + int.from_bytes(data[offset:offset + 32], 'big')
+    if end > len(data):
+        return None
+    return bytes(data[offset + 32:end]).decode('utf-8', 'replace')
+
+
+def format_units(value: int, decimals: int) -> str:
+    """Целочисленное значение токена строкой с decimals знаками, без float и Decimal"""
+    whole, fraction = divmod(value, get_divisor(decimals))
+    if not decimals:
+        return str(whole)
+    return f"{whole}.{fraction:0{decimals}d}".rstrip('0').rstrip('.')
+
+
+class RateLimiter:
+    """Адаптивный token bucket для запросов к RPC"""
+
+    # Запросы выравниваются под лимит провайдера заранее, а не после 429 с его
+    # откатом. На 429 скорость падает вдвое и восстанавливается постепенно (AIMD)
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, count: int = 1):
+        count = min(count, self.burst)
+        # Ожидающие обслуживаются по очереди
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    self.rate = min(self.max_rate, self.rate + RATE_RECOVERY_STEP)
+                    return
+                await asyncio.sleep((count - self.tokens) / self.rate)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        self.rate = max(self.rate / 2, RATE_LIMIT_MIN)
+        self.tokens = 0.0
+        if retry_after:
+            self.blocked_until = time.monotonic() + retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After в форме HTTP-даты не используется, хватает снижения скорости
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _json_default(value):
+    # Типы web3, которые orjson не сериализует сам: HexBytes/bytes и AttributeDict
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class OrjsonCodecMixin:
+    """Кодирование запросов и разбор ответов JSON-RPC через orjson"""
+
+    # Полные блоки весят мегабайты, разбор ответа - основная нагрузка на CPU.
+    # Batch-запрос web3 собирает из encode_rpc_request, поэтому orjson кодирует и его
+    def encode_rpc_request(self, method, params) -> bytes:
+        if _jdumps is None:
+            return super().encode_rpc_request(method, params)
+        rpc_dict = {"jsonrpc": "2.0", "method": method, "params": params or [], "id": next(self.request_counter)}
+        try:
+            return _jdumps(rpc_dict, default=_json_default)
+        except TypeError:
+            # Целые больше 64 бит и прочие редкие значения кодирует web3
+            return super().encode_rpc_request(method, params)
+
+    @staticmethod
+    def decode_rpc_response(raw_response: bytes):
+        return _jloads(raw_response)
+
+
+class OrjsonHTTPProvider(OrjsonCodecMixin, AsyncWeb3.AsyncHTTPProvider):
+    """HTTP-провайдер, кодирующий и разбирающий JSON-RPC через orjson"""
+
+    rate_limiter: Optional[RateLimiter] = None
+
+    async def make_request(self, method, params):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        try:
+            return await super().make_request(method, params)
+        except aiohttp.ClientResponseError as e:
+            self._on_status_error(e)
+            raise
+
+    async def make_batch_request(self, requests):
+        # Провайдер считает каждый элемент batch отдельным запросом
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(len(requests))
+        try:
+            return await super().make_batch_request(requests)
+        except aiohttp.ClientResponseError as e:
+            self._on_status_error(e)
+            raise
+
+    def _on_status_error(self, error: aiohttp.ClientResponseError):
+        if error.status == 429 and self.rate_limiter is not None:
+            self.rate_limiter.throttle(parse_retry_after(error.headers.get('Retry-After') if error.headers else None))
+
+
+class Http2Provider(OrjsonCodecMixin, AsyncJSONBaseProvider):
+    """JSON-RPC поверх одного HTTP/2-соединения httpx"""
+
+    # Параллельные запросы сканера мультиплексируются в одном TLS-соединении вместо
+    # пула HTTP/1.1, а HPACK сжимает повторяющиеся заголовки
+    def __init__(self, endpoint_uri: str, timeout: float = 30):
+        super().__init__()
+        self.endpoint_uri = endpoint_uri
+        self.rate_limiter: Optional[RateLimiter] = None
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+            headers={'Content-Type': 'application/json'}
+        )
+
+    async def _post(self, body: bytes, request_count: int = 1):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(request_count)
+        try:
+            response = await self._client.post(self.endpoint_uri, content=body)
+            if response.status_code == 429 and self.rate_limiter is not None:
+                self.rate_limiter.throttle(parse_retry_after(response.headers.get('Retry-After')))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            # Ошибки транспорта в виде исключения web3: их ловят те же обработчики RPC_ERRORS,
+            # что и ошибки aiohttp-провайдера
+            raise ProviderConnectionError(f"HTTP/2 запрос к {self.endpoint_uri} не удался: {e}") from e
+        return _jloads(response.content)
+
+    async def make_request(self, method, params):
+        return await self._post(self.encode_rpc_request(method, params))
+
+    async def make_batch_request(self, requests):
+        # Провайдер считает каждый элемент batch отдельным запросом
+        responses = await self._post(self.encode_batch_rpc_request(requests), len(requests))
+        if isinstance(responses, list):
+            # Порядок ответов в batch не гарантирован, web3 сопоставляет их по позиции.
+            # У ответа-ошибки id может быть null
+            responses.sort(key=lambda response: response.get('id') or 0)
+        return responses
+
+    async def disconnect(self):
+        await self._client.aclose()
 
 
 class TokenTransferEvent:
@@ -56,16 +339,18 @@ class TokenTransferEvent:
         self.token_symbol = token_symbol
         self.token_decimals = token_decimals
         self.timestamp = int(time.time())
+        self._formatted_value = None
 
     def get_formatted_value(self) -> str:
-        if self.value is None:
-            return "N/A"
-
-        if self.token_type in ['ERC20', 'NATIVE']:
-            formatted_value = self.value / (10 ** self.token_decimals)
-            return f"{formatted_value:.8f}".rstrip('0').rstrip('.') if '.' in f"{formatted_value:.8f}" else f"{formatted_value:.8f}"
-        else:
-            return str(self.value)
+        if self._formatted_value is None:
+            if self.value is None:
+                self._formatted_value = "N/A"
+            elif self.token_type in ['ERC20', 'NATIVE']:
+                # Формат .8f всегда содержит точку, поэтому хвостовые нули срезаются без проверки
+                self._formatted_value = f"{self.value / get_divisor(self.token_decimals):.8f}".rstrip('0').rstrip('.')
+            else:
+                self._formatted_value = str(self.value)
+        return self._formatted_value
 
     def __str__(self):
         if self.token_type in ['ERC20', 'NATIVE']:
@@ -95,13 +380,15 @@ class BalanceChangeEvent:
         self.token_symbol = token_symbol
         self.token_decimals = token_decimals
         self.timestamp = int(time.time())
+        self._formatted_change = None
 
     def get_formatted_change(self) -> str:
-        if self.token_type in ['ERC20', 'NATIVE']:
-            formatted_change = self.change / (10 ** self.token_decimals)
-            return f"{formatted_change:+.8f}".rstrip('0').rstrip('.') if '.' in f"{formatted_change:+.8f}" else f"{formatted_change:+.8f}"
-        else:
-            return f"{self.change:+d}"
+        if self._formatted_change is None:
+            if self.token_type in ['ERC20', 'NATIVE']:
+                self._formatted_change = f"{self.change / get_divisor(self.token_decimals):+.8f}".rstrip('0').rstrip('.')
+            else:
+                self._formatted_change = f"{self.change:+d}"
+        return self._formatted_change
 
     def __str__(self):
         return (f"[BALANCE] Address: {self.wallet_address} | "
@@ -113,22 +400,61 @@ class BalanceChangeEvent:
 class PolygonScanner:
 
     def __init__(self, wallet_addresses: List[str], start_block: Optional[int] = None,
-                 scan_interval: int = 30, balance_check_interval: int = 300):
+                 scan_interval: int = 30, balance_check_interval: int = 300, block_batch_size: int = 25,
+                 track_native_transfers: bool = True, token_cache_path: str = TOKEN_CACHE_PATH,
+                 max_concurrent_requests: int = 16, ws_rpc_url: Optional[str] = None,
+                 balance_check_blocks: int = 10, full_balance_check_every: int = 10,
+                 rpc_rate_limit: float = 25, rpc_burst: int = 50):
         # Конвертируем адреса в checksum формат и сохраняем оба варианта
         self.wallet_addresses_original = [Web3.to_checksum_address(addr) for addr in wallet_addresses]
         self.wallet_addresses = [addr.lower() for addr in self.wallet_addresses_original]
         self.wallet_set = set(self.wallet_addresses)
+        self.wallet_lower_to_checksum = {addr.lower(): addr for addr in self.wallet_addresses_original}
+        # Адреса кошельков в виде 32-байтных topics: логи сверяются без срезов и перевода в hex
+        self.wallet_topic_set: FrozenSet[bytes] = frozenset(
+            bytes(12) + bytes.fromhex(addr[2:]) for addr in self.wallet_addresses)
+        self.wallet_topics = [Web3.to_hex(topic) for topic in self.wallet_topic_set]
+        self.wallet_bloom_bits = [bloom_bits(topic) for topic in self.wallet_topic_set]
         self.scan_interval = scan_interval
         self.balance_check_interval = balance_check_interval
+        # С ws_rpc_url балансы проверяются по подписке newHeads каждые balance_check_blocks блоков
+        self.ws_rpc_url = ws_rpc_url
+        self.balance_check_blocks = balance_check_blocks
+        # Кошельки с транзакциями в обработанных блоках: только их нативный баланс перечитывается
+        # между полными проверками (раз в full_balance_check_every, ловят внутренние переводы)
+        self.full_balance_check_every = full_balance_check_every
+        self.balance_checks_done = 0
+        self.touched_wallets: Set[str] = set()
+        self.pending_touched_wallets: Set[str] = set()
+        self.block_batch_size = block_batch_size
+        self.track_native_transfers = track_native_transfers
         self.token_info_cache = {}
+        self.token_type_cache = {}
+        self.token_type_probes = {}
+        self.pending_token_meta: Dict[str, Dict[str, Any]] = {}
+        self.token_cache_path = token_cache_path
         self.wallet_balances = {}
         self.tracked_tokens = set()
+        self.start_block = start_block
+        # Ограничение одновременных запросов к RPC: поблочная догрузка после простоя не должна упираться в 429
+        self.rpc_semaphore = asyncio.Semaphore(max_concurrent_requests)
+        # Диапазоны блоков от опроса сети к обработке; размер ограничивает опережение опроса
+        self.block_queue: asyncio.Queue = asyncio.Queue(maxsize=4)
 
         # ankr_rpc_url = "https://rpc.ankr.com/polygon/fb00ba52a7de8c2eb4acca0df5590553673491333704db7739fbdf8a40d0f1ad" #poligon
 
         ankr_rpc_url = "https://rpc.ankr.com/bsc/fb00ba52a7de8c2eb4acca0df5590553673491333704db7739fbdf8a40d0f1ad"  # bnd
 
-        self.w3 = Web3(Web3.HTTPProvider(ankr_rpc_url))
+        if httpx is not None:
+            provider = Http2Provider(ankr_rpc_url, timeout=30)
+        else:
+            # Встроенные повторы web3 отключены: иначе 429 доходит до RateLimiter только после
+            # их собственного отката. Неудачные окна и проверки повторяют циклы сканера
+            provider = OrjsonHTTPProvider(ankr_rpc_url, request_kwargs={'timeout': aiohttp.ClientTimeout(total=30)},
+                                          exception_retry_configuration=None)
+        # Общий лимит запросов в секунду на все задачи сканера
+        provider.rate_limiter = RateLimiter(rpc_rate_limit, rpc_burst)
+        self.w3 = AsyncWeb3(provider)
 
         # Добавляем POA middleware для BSC/Polygon
         try:
@@ -146,18 +472,84 @@ class PolygonScanner:
             except ImportError:
                 logger.warning("POA middleware недоступен, возможны проблемы с POA сетями")
 
-        if not self.w3.is_connected():
+        self.multicall = self.w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+
+    async def connect(self):
+        if isinstance(self.w3.provider, OrjsonHTTPProvider):
+            # Один пул keep-alive соединений на все запросы к RPC
+            await self.w3.provider.cache_async_session(
+                aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=600, keepalive_timeout=60))
+            )
+
+        if not await self.w3.is_connected():
             raise ConnectionError("Не удалось подключиться к блокчейну")
 
-        self.chain_id = self.w3.eth.chain_id
+        self.chain_id = await self.w3.eth.chain_id
         logger.info(f"Успешное подключение к сети. Chain ID: {self.chain_id}")
 
         self.native_currency = self._get_native_currency_info()
         logger.info(f"Нативная валюта сети: {self.native_currency['symbol']}")
 
-        self.last_processed_block = start_block or self.w3.eth.block_number - 10
+        self._load_token_meta()
+
+        self.last_processed_block = self.start_block or await self.w3.eth.block_number - 10
         logger.info(f"Начало сканирования с блока {self.last_processed_block}")
 
+    def _load_token_meta(self):
+        # Метаданные токенов неизменны, поэтому переживают перезапуск в sqlite
+        os.makedirs(os.path.dirname(os.path.abspath(self.token_cache_path)), exist_ok=True)
+        # Короткий timeout: запись идет из цикла событий, долго ждать блокировку нельзя
+        self.token_db = sqlite3.connect(self.token_cache_path, isolation_level=None, timeout=1)
+        self.token_db.execute("""
+                              CREATE TABLE IF NOT EXISTS token_meta (
+                                  chain_id INTEGER NOT NULL,
+                                  address TEXT NOT NULL,
+                                  type TEXT,
+                                  symbol TEXT,
+                                  decimals INTEGER,
+                                  PRIMARY KEY (chain_id, address)
+                              )
+                              """)
+        rows = self.token_db.execute("SELECT address, type, symbol, decimals FROM token_meta WHERE chain_id = ?",
+                                     (self.chain_id,))
+        for address, token_type, symbol, decimals in rows:
+            if token_type is not None:
+                self.token_type_cache[address] = token_type
+            if symbol is not None:
+                self.token_info_cache[address] = (symbol, decimals)
+        logger.info(f"Загружено из кэша токенов: {len(self.token_type_cache)} типов, {len(self.token_info_cache)} метаданных")
+
+    def _save_token_meta(self, address: str, column_values: Dict[str, Any]):
+        # Запись копится в памяти: блокировка sqlite не должна держаться на время запросов к сети
+        self.pending_token_meta.setdefault(address, {}).update(column_values)
+
+    def _flush_token_meta(self):
+        """Запись накопленных метаданных токенов одной короткой транзакцией"""
+        if not self.pending_token_meta:
+            return
+        rows = [(self.chain_id, address, meta.get('type'), meta.get('symbol'), meta.get('decimals'))
+                for address, meta in self.pending_token_meta.items()]
+        try:
+            self.token_db.execute("BEGIN IMMEDIATE")
+            try:
+                # NULL в строке означает "не менять": тип и символ токена записываются независимо
+                self.token_db.executemany(
+                    "INSERT INTO token_meta (chain_id, address, type, symbol, decimals) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (chain_id, address) DO UPDATE SET "
+                    "type = COALESCE(excluded.type, type), "
+                    "symbol = COALESCE(excluded.symbol, symbol), "
+                    "decimals = COALESCE(excluded.decimals, decimals)",
+                    rows)
+            except sqlite3.Error:
+                self.token_db.execute("ROLLBACK")
+                raise
+            self.token_db.execute("COMMIT")
+        except sqlite3.Error as e:
+            # Кэш занят другим экземпляром сканера: записи остаются до следующего окна
+            logger.warning("Не удалось сохранить кэш токенов: %s", e)
+            return
+        self.pending_token_meta = {}
+
     def _get_native_currency_info(self) -> Dict[str, Any]:
         if self.chain_id == 56:  # BSC
             return {"symbol": "BNB", "decimals": 18}
@@ -168,114 +560,202 @@ class PolygonScanner:
             return {"symbol": "NATIVE", "decimals": 18}
 
     async def run(self):
+        await self.connect()
+
         balance_check_task = asyncio.create_task(self.check_balances_loop())
         scan_task = asyncio.create_task(self.scan_blocks_loop())
+        process_task = asyncio.create_task(self.process_blocks_loop())
 
-        await asyncio.gather(scan_task, balance_check_task)
+        await asyncio.gather(scan_task, process_task, balance_check_task)
 
     async def check_balances_loop(self):
         await self.initialize_balances()
 
+        if self.ws_rpc_url:
+            await self.check_balances_on_heads()
+            return
+
         while True:
             try:
                 logger.info("Проверка изменений балансов...")
-                current_block = self.w3.eth.block_number
-
-                for wallet_address in self.wallet_addresses_original:
-                    await self.check_native_balance(wallet_address, current_block)
-
-                    for token_address in self.tracked_tokens:
-                        await self.check_token_balance(wallet_address, token_address, current_block)
+                current_block = await self.w3.eth.block_number
+                await self.check_balances(current_block)
 
                 await asyncio.sleep(self.balance_check_interval)
             except Exception as e:
                 logger.error(f"Ошибка при проверке балансов: {str(e)}")
                 await asyncio.sleep(5)
 
+    async def check_balances_on_heads(self):
+        # Новые блоки приходят по WebSocket без холостого опроса; чтения остаются на HTTP-провайдере
+        heads_seen = 0
+        async for ws_w3 in AsyncWeb3(WebSocketProvider(self.ws_rpc_url)):
+            try:
+                await ws_w3.eth.subscribe('newHeads')
+                logger.info("Подписка newHeads активна, проверка балансов каждые %s блоков", self.balance_check_blocks)
+                async for message in ws_w3.socket.process_subscriptions():
+                    heads_seen += 1
+                    if heads_seen % self.balance_check_blocks:
+                        continue
+                    block_number = message['result']['number']
+                    try:
+                        await self.check_balances(block_number)
+                    except RPC_ERRORS as e:
+                        logger.error(f"Ошибка при проверке балансов: {str(e)}")
+            except (ConnectionClosed, Web3Exception, OSError) as e:
+                # Итератор провайдера переподключается сам
+                logger.warning("Соединение WebSocket потеряно, переподключение: %s", e)
+
     async def initialize_balances(self):
         logger.info("Инициализация начальных балансов...")
-        current_block = self.w3.eth.block_number
 
-        for wallet_address in self.wallet_addresses_original:
-            # Инициализация баланса нативной валюты
-            balance_key = f"{wallet_address.lower()}:NATIVE"
-            balance = await asyncio.to_thread(self.w3.eth.get_balance, wallet_address)
-            self.wallet_balances[balance_key] = balance
-            logger.info(f"Начальный баланс {self.native_currency['symbol']} для {wallet_address}: {balance / (10 ** self.native_currency['decimals'])}")
+        # Запросы кошельков идут параллельно в пределах rpc_semaphore
+        await asyncio.gather(*(self._initialize_wallet_balance(wallet_address)
+                               for wallet_address in self.wallet_addresses_original))
 
-    async def check_native_balance(self, wallet_address: str, block_number: int):
+    async def _initialize_wallet_balance(self, wallet_address: str):
+        try:
+            async with self.rpc_semaphore:
+                # Один медленный ответ RPC не задерживает инициализацию остальных кошельков
+                balance = await asyncio.wait_for(self.w3.eth.get_balance(wallet_address), timeout=WALLET_RPC_TIMEOUT)
+        except RPC_ERRORS as e:
+            # Баланс не сохраняется: первое успешное чтение станет точкой отсчета
+            logger.warning("Не удалось получить начальный баланс %s: %s", wallet_address, e)
+            return
+
+        # Инициализация баланса нативной валюты
         balance_key = f"{wallet_address.lower()}:NATIVE"
-        old_balance = self.wallet_balances.get(balance_key, 0)
-
+        self.wallet_balances[balance_key] = balance
+        logger.info(f"Начальный баланс {self.native_currency['symbol']} для {wallet_address}: {format_units(balance, self.native_currency['decimals'])}")
+
+    async def check_balances(self, block_number: int):
+        self.balance_checks_done += 1
+        # Без полных транзакций блоков активность кошельков не видна, проверка всегда полная
+        if self.track_native_transfers and self.balance_checks_done % self.full_balance_check_every:
+            await self.check_touched_balances()
+            return
+
+        token_infos = {}
+        for token_address in list(self.tracked_tokens):
+            token_type = await self._determine_token_type(token_address)
+            if token_type == 'ERC20':
+                token_infos[token_address] = await self._get_token_info(token_address, token_type)
+
+        # Все балансы всех кошельков одним eth_call через Multicall3
+        pairs = [(wallet_address, token_address) for wallet_address in self.wallet_addresses_original
+                 for token_address in ['NATIVE', *token_infos]]
+        balances = await self._multicall_balances(pairs)
+
+        for (wallet_address, token_address), new_balance in zip(pairs, balances):
+            if token_address == 'NATIVE':
+                token_info = (self.native_currency["symbol"], self.native_currency["decimals"])
+            else:
+                token_info = token_infos[token_address]
+            self._apply_balance(wallet_address, token_address, new_balance, block_number, *token_info)
+
+    async def check_touched_balances(self):
+        # ERC20 обновляются по логам переводов; здесь только нативный баланс кошельков с транзакциями.
+        # Чтение закреплено за последним обработанным блоком, чья активность уже учтена
+        block_number = self.last_processed_block
+        touched, self.touched_wallets = self.touched_wallets, set()
+        if not touched:
+            logger.info("Нет транзакций отслеживаемых кошельков до блока %s, проверка пропущена", block_number)
+            return
+
+        pairs = [(wallet_address, 'NATIVE') for wallet_address in touched]
         try:
-            new_balance = await asyncio.to_thread(self.w3.eth.get_balance, wallet_address)
-
-            if new_balance != old_balance:
-                event = BalanceChangeEvent(
-                    wallet_address=wallet_address.lower(),
-                    token_address="NATIVE",
-                    token_type="NATIVE",
-                    old_balance=old_balance,
-                    new_balance=new_balance,
-                    block_number=block_number,
-                    token_symbol=self.native_currency["symbol"],
-                    token_decimals=self.native_currency["decimals"]
-                )
-                print(event)
-                logger.info(f"Обнаружено изменение баланса нативной валюты: {event}")
-
-                self.wallet_balances[balance_key] = new_balance
-        except Exception as e:
-            logger.error(f"Ошибка при проверке нативного баланса {wallet_address}: {str(e)}")
-
-    async def check_token_balance(self, wallet_address: str, token_address: str, block_number: int):
+            balances = await self._multicall_balances(pairs, block_number)
+        except RPC_ERRORS:
+            # Кошельки проверятся в следующий раз
+            self.touched_wallets |= touched
+            raise
+
+        for (wallet_address, token_address), new_balance in zip(pairs, balances):
+            self._apply_balance(wallet_address, token_address, new_balance, block_number,
+                                self.native_currency["symbol"], self.native_currency["decimals"])
+
+    def _apply_balance(self, wallet_address: str, token_address: str, new_balance: Optional[int],
+                       block_number: int, token_symbol: str, token_decimals: int):
         balance_key = f"{wallet_address.lower()}:{token_address}"
-        old_balance = self.wallet_balances.get(balance_key, 0)
-
+        if new_balance is None:
+            return
+        old_balance = self.wallet_balances.get(balance_key)
+        if old_balance is None:
+            # Первое реальное значение (начальное чтение не удалось или токен новый) - точка
+            # отсчета, а не изменение с нуля
+            self.wallet_balances[balance_key] = new_balance
+            return
+        if new_balance == old_balance:
+            return
+
+        token_type = 'NATIVE' if token_address == 'NATIVE' else 'ERC20'
+        event = BalanceChangeEvent(
+            wallet_address=wallet_address.lower(),
+            token_address=token_address,
+            token_type=token_type,
+            old_balance=old_balance,
+            new_balance=new_balance,
+            block_number=block_number,
+            token_symbol=token_symbol,
+            token_decimals=token_decimals
+        )
+        print(event)
+        if token_type == 'NATIVE':
+            logger.info(f"Обнаружено изменение баланса нативной валюты: {event}")
+        else:
+            logger.info(f"Обнаружено изменение баланса ERC20: {event}")
+
+        self.wallet_balances[balance_key] = new_balance
+
+    async def _multicall(self, calls: List[Tuple[str, bytes]], block_identifier='latest') -> List[Optional[bytes]]:
+        # allowFailure: неудачный вызов возвращает None, не роняя остальные
+        results = await self.multicall.functions.aggregate3(
+            [(target, True, data) for target, data in calls]).call(block_identifier=block_identifier)
+        return [data if success else None for success, data in results]
+
+    async def _multicall_balances(self, pairs: List[Tuple[str, str]], block_identifier='latest') -> List[Optional[int]]:
+        calls = []
+        for wallet_address, token_address in pairs:
+            wallet_arg = bytes.fromhex(wallet_address[2:].rjust(64, '0'))
+            if token_address == 'NATIVE':
+                calls.append((MULTICALL3_ADDRESS, GET_ETH_BALANCE_SELECTOR + wallet_arg))
+            else:
+                calls.append((to_checksum_address(token_address), BALANCE_OF_SELECTOR + wallet_arg))
+
+        # Большие наборы кошелек x токен делятся на части под лимит газа eth_call, части идут параллельно
+        chunks = await asyncio.gather(*(self._multicall(calls[start:start + BALANCE_BATCH_SIZE], block_identifier)
+                                        for start in range(0, len(calls), BALANCE_BATCH_SIZE)))
+        # Ответ balanceOf/getEthBalance - одно слово uint256, читается без eth_abi
+        return [int.from_bytes(data[:32], 'big') if data and len(data) >= 32 else None
+                for chunk in chunks for data in chunk]
+
+    async def refresh_balances(self, pairs: Set[Tuple[str, str]], block_number: int):
+        # Каждая пара (кошелек, токен) окна запрашивается один раз, сколько бы переводов ни было
+        pairs = list(pairs)
         try:
-            token_type = await self._determine_token_type(token_address)
-            token_symbol, token_decimals = await self._get_token_info(token_address, token_type)
-
-            if token_type == 'ERC20':
-                checksum_address = Web3.to_checksum_address(token_address)
-                erc20_abi = [
-                    {"constant": True, "inputs": [{"name": "_owner", "type": "address"}],
-                     "name": "balanceOf", "outputs": [{"name": "balance", "type": "uint256"}],
-                     "type": "function"}
-                ]
-
-                contract = self.w3.eth.contract(address=checksum_address, abi=erc20_abi)
-                new_balance = await asyncio.to_thread(
-                    contract.functions.balanceOf(wallet_address).call
-                )
-
-                if new_balance != old_balance:
-                    event = BalanceChangeEvent(
-                        wallet_address=wallet_address.lower(),
-                        token_address=token_address,
-                        token_type=token_type,
-                        old_balance=old_balance,
-                        new_balance=new_balance,
-                        block_number=block_number,
-                        token_symbol=token_symbol,
-                        token_decimals=token_decimals
-                    )
-                    print(event)
-                    logger.info(f"Обнаружено изменение баланса ERC20: {event}")
-
-                    self.wallet_balances[balance_key] = new_balance
+            balances = await self._multicall_balances(pairs)
+        except RPC_ERRORS as e:
+            logger.error("Ошибка при обновлении баланса: %s", e)
+            return
 
-        except Exception as e:
-            logger.error(f"Ошибка при проверке баланса токена {token_address} для {wallet_address}: {str(e)}")
+        for (wallet_address, token_address), new_balance in zip(pairs, balances):
+            # Метаданные уже в кэше: токен встречался в логах этого окна
+            token_symbol, token_decimals = await self._get_token_info(token_address, 'ERC20')
+            self._apply_balance(wallet_address, token_address, new_balance, block_number, token_symbol, token_decimals)
 
     async def scan_blocks_loop(self):
+        # Производитель: опрашивает сеть и ставит новые диапазоны в очередь, пока
+        # обработчик разбирает предыдущие
+        scheduled_block = self.last_processed_block
         while True:
             try:
-                current_block = self.w3.eth.block_number
-                if current_block > self.last_processed_block:
-                    logger.info(f"Сканирование блоков с {self.last_processed_block + 1} по {current_block}")
-                    await self.process_blocks(self.last_processed_block + 1, current_block)
-                    self.last_processed_block = current_block
+                current_block = await self.w3.eth.block_number
+                if current_block > scheduled_block:
+                    logger.info(f"Сканирование блоков с {scheduled_block + 1} по {current_block}")
+                    for batch_start in range(scheduled_block + 1, current_block + 1, self.block_batch_size):
+                        batch_end = min(batch_start + self.block_batch_size - 1, current_block)
+                        await self.block_queue.put((batch_start, batch_end))
+                        scheduled_block = batch_end
                 else:
                     logger.info(f"Ожидание новых блоков. Текущий блок: {current_block}")
 
@@ -284,285 +764,348 @@ class PolygonScanner:
                 logger.error(f"Ошибка в цикле сканирования: {str(e)}")
                 await asyncio.sleep(5)
 
-    async def process_blocks(self, from_block: int, to_block: int):
-        tasks = [self.process_block(block_num) for block_num in range(from_block, to_block + 1)]
-        await asyncio.gather(*tasks, return_exceptions=True)
+    async def process_blocks_loop(self):
+        # Потребитель: диапазоны обрабатываются строго по порядку, неудачный повторяется
+        # с окна, следующего за последним полностью обработанным
+        while True:
+            from_block, to_block = await self.block_queue.get()
+            while True:
+                try:
+                    await self.process_blocks(max(from_block, self.last_processed_block + 1), to_block)
+                    break
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке блоков {self.last_processed_block + 1}-{to_block}: {str(e)}")
+                    await asyncio.sleep(5)
+            self.block_queue.task_done()
 
-    async def process_block(self, block_number: int):
+    async def process_blocks(self, from_block: int, to_block: int):
+        for batch_start in range(from_block, to_block + 1, self.block_batch_size):
+            block_numbers = range(batch_start, min(batch_start + self.block_batch_size, to_block + 1))
+            # Сначала все данные окна загружаются, и только потом печатаются события: ошибка
+            # загрузки повторяет окно без повторных уведомлений
+            blocks = None
+            need_logs = True
+            # Полные транзакции блоков нужны только для нативных переводов; без них изменения
+            # нативного баланса видны через check_balances
+            if self.track_native_transfers:
+                blocks = await self._get_blocks(block_numbers)
+                # Заголовки блоков уже загружены: если ни один logsBloom не допускает перевода
+                # отслеживаемых кошельков, eth_getLogs для окна не нужен
+                need_logs = any(self._block_may_have_transfers(block) for block in blocks)
+            logs = await self._get_transfer_logs(block_numbers.start, block_numbers.stop - 1) if need_logs else []
+
+            if blocks is not None:
+                for block_number, block in zip(block_numbers, blocks):
+                    self.process_block(block_number, block)
+            await self.process_logs(logs, block_numbers.stop - 1)
+
+            # Кошельки окна становятся видны проверке балансов вместе с его последним блоком
+            self.touched_wallets |= self.pending_touched_wallets
+            self.pending_touched_wallets = set()
+            self.last_processed_block = block_numbers.stop - 1
+
+    def _block_may_have_transfers(self, block) -> bool:
+        bloom = block.get('logsBloom') if block else None
+        if not bloom:
+            return True
+        return (any(bloom_contains(bloom, bits) for bits in TRANSFER_EVENTS_BLOOM_BITS) and
+                any(bloom_contains(bloom, bits) for bits in self.wallet_bloom_bits))
+
+    async def _get_blocks_batch(self, block_numbers: range):
+        """Получение диапазона блоков одним JSON-RPC batch-запросом"""
         try:
+            async with self.w3.batch_requests() as batch:
+                for block_number in block_numbers:
+                    batch.add(self.w3.eth.get_block(block_number, full_transactions=True))
+                return await batch.async_execute()
+        except (Web3Exception, ValueError) as e:
+            # Ошибка одного элемента (POA extraData, отсутствующий блок) роняет весь batch,
+            # такие диапазоны дочитываем поблочно
+            logger.debug("Batch блоков %s-%s не удался: %s", block_numbers.start, block_numbers.stop - 1, e)
+            return None
+
+    async def _get_blocks(self, block_numbers: range):
+        blocks = await self._get_blocks_batch(block_numbers)
+        if blocks is None:
             # Используем альтернативный способ получения блока для POA сетей
-            block = await asyncio.to_thread(self._safe_get_block, block_number)
-            if not block:
-                return
+            blocks = await asyncio.gather(*(self._safe_get_block(block_number) for block_number in block_numbers))
+        return blocks
 
-            for tx in block.transactions:
-                await self.process_transaction(tx, block_number)
+    def process_block(self, block_number: int, block):
+        if not block:
+            return
 
-        except BlockNotFound:
-            logger.warning(f"Блок {block_number} не найден")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке блока {block_number}: {str(e)}")
+        # Транзакции блока нужны только для нативных переводов, токены приходят из eth_getLogs
+        for tx in block.transactions:
+            if self._is_wallet_transaction(tx):
+                self._mark_touched(tx)
+                self.process_native_transfer(tx, block_number)
 
-    def _safe_get_block(self, block_number: int):
+    async def _safe_get_block(self, block_number: int):
         """Безопасное получение блока с обработкой POA специфики"""
         try:
-            return self.w3.eth.get_block(block_number, full_transactions=True)
+            async with self.rpc_semaphore:
+                return await self.w3.eth.get_block(block_number, full_transactions=True)
         except ValueError as e:
             if "extraData" in str(e):
-                logger.debug(f"POA блок {block_number}, пропускаем из-за extraData")
+                logger.debug("POA блок %s, пропускаем из-за extraData", block_number)
                 return None
             raise e
 
-    async def process_transaction(self, tx, block_number: int):
+    async def process_logs(self, logs, to_block: int):
+        # Пары (кошелек, токен), чьи балансы обновляются одним multicall после обработки окна
+        dirty_balances = set()
+        await self._prefetch_token_meta([log['address'].lower() for log in logs])
+        for log in logs:
+            await self.process_log(log, dirty_balances)
+        # Новые метаданные токенов окна записываются в sqlite одной транзакцией после всех запросов
+        self._flush_token_meta()
+
+        if dirty_balances:
+            await self.refresh_balances(dirty_balances, to_block)
+
+    async def _get_transfer_logs(self, from_block: int, to_block: int):
+        """Логи переводов токенов отслеживаемых кошельков одним JSON-RPC batch-запросом"""
+        # Ошибка eth_getLogs (лимит запросов, слишком много результатов) не глотается:
+        # process_blocks_loop повторит окно, иначе его переводы потерялись бы
+        transfer = Web3.to_hex(ERC20_TRANSFER_EVENT)
+        erc1155 = [Web3.to_hex(ERC1155_TRANSFER_SINGLE_EVENT), Web3.to_hex(ERC1155_TRANSFER_BATCH_EVENT)]
+        # Кошелек в from/to: topics[1]/[2] у Transfer и topics[2]/[3] у ERC1155
+        topic_filters = [
+            [transfer, self.wallet_topics],
+            [[transfer, *erc1155], None, self.wallet_topics],
+            [erc1155, None, None, self.wallet_topics],
+        ]
+
+        async with self.w3.batch_requests() as batch:
+            for topics in topic_filters:
+                batch.add(self.w3.eth.get_logs({'fromBlock': from_block, 'toBlock': to_block, 'topics': topics}))
+            results = await batch.async_execute()
+
+        # Перевод между двумя отслеживаемыми кошельками попадает в несколько фильтров
+        logs = {(log['transactionHash'], log['logIndex']): log for result in results for log in result}
+        return sorted(logs.values(), key=lambda log: (log['blockNumber'], log['logIndex']))
+
+    def _is_wallet_transaction(self, tx) -> bool:
+        to_address = tx.get('to')
+        return tx['from'].lower() in self.wallet_set or (to_address is not None and to_address.lower() in self.wallet_set)
+
+    def _mark_touched(self, tx):
+        # Любая транзакция кошелька меняет его нативный баланс: перевод или оплата газа
+        for address in (tx['from'], tx.get('to')):
+            checksum_wallet = self.wallet_lower_to_checksum.get(address.lower()) if address else None
+            if checksum_wallet:
+                self.pending_touched_wallets.add(checksum_wallet)
+
+    def process_native_transfer(self, tx, block_number: int):
         tx_hash = tx['hash'].hex()
         try:
             from_address = tx['from'].lower()
             to_address = tx.get('to', '').lower() if tx.get('to') else None
 
-            if from_address in self.wallet_set or to_address in self.wallet_set:
-                # Проверка на нативный перевод
-                if to_address and tx.get('value', 0) > 0 and (not tx.get('input') or tx.get('input') == '0x'):
-                    value = tx.get('value', 0)
+            # Проверка на нативный перевод
+            if to_address and tx.get('value', 0) > 0 and (not tx.get('input') or tx.get('input') == '0x'):
+                value = tx.get('value', 0)
+                event = TokenTransferEvent(
+                    tx_hash=tx_hash,
+                    block_number=block_number,
+                    token_address="NATIVE",
+                    token_type="NATIVE",
+                    from_address=from_address,
+                    to_address=to_address,
+                    value=value,
+                    token_symbol=self.native_currency["symbol"],
+                    token_decimals=self.native_currency["decimals"]
+                )
+                print(event)
+                logger.info("Обнаружен нативный перевод: %s", event)
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.error("Ошибка при обработке транзакции %s: %s", tx_hash, e)
+
+    async def process_log(self, log, dirty_balances: Set[Tuple[str, str]]):
+        tx_hash = log['transactionHash'].hex()
+        block_number = log['blockNumber']
+        try:
+            # topics и data из get_logs всегда HexBytes: разбор идет по байтам в log_decode
+            transfer = decode_transfer_log(log['topics'], log['data'], self.wallet_topic_set)
+            if transfer is None:
+                return
+
+            contract_address = log['address'].lower()
+            # Добавляем токен в список отслеживаемых
+            self.tracked_tokens.add(contract_address)
+
+            if transfer.event == ERC20_TRANSFER_EVENT:
+                token_type = await self._determine_token_type(contract_address)
+                token_symbol, token_decimals = await self._get_token_info(contract_address, token_type)
+
+                if token_type == 'ERC721':
+                    # tokenId из topics[3]; нестандартные контракты кладут его в data
                     event = TokenTransferEvent(
                         tx_hash=tx_hash,
                         block_number=block_number,
-                        token_address="NATIVE",
-                        token_type="NATIVE",
-                        from_address=from_address,
-                        to_address=to_address,
-                        value=value,
-                        token_symbol=self.native_currency["symbol"],
-                        token_decimals=self.native_currency["decimals"]
+                        token_address=contract_address,
+                        token_type='ERC721',
+                        from_address=transfer.from_address,
+                        to_address=transfer.to_address,
+                        token_id=transfer.token_id if transfer.token_id is not None else transfer.value,
+                        value=1,
+                        token_symbol=token_symbol,
+                        token_decimals=0
+                    )
+                else:
+                    event = TokenTransferEvent(
+                        tx_hash=tx_hash,
+                        block_number=block_number,
+                        token_address=contract_address,
+                        token_type='ERC20',
+                        from_address=transfer.from_address,
+                        to_address=transfer.to_address,
+                        value=transfer.value or 0,
+                        token_symbol=token_symbol,
+                        token_decimals=token_decimals
                     )
-                    print(event)
-                    logger.info(f"Обнаружен нативный перевод: {event}")
-
-                try:
-                    receipt = await asyncio.to_thread(self.w3.eth.get_transaction_receipt, tx_hash)
-                except TransactionNotFound:
-                    logger.debug(f"Транзакция {tx_hash} не найдена, пропускаем")
-                    return
 
-                if not receipt or not hasattr(receipt, 'logs'):
-                    logger.debug(f"Отсутствуют логи для транзакции {tx_hash}")
-                    return
+                print(event)
 
-                for log in receipt.logs:
-                    contract_address = log['address'].lower()
-                    topics = [t.hex() if isinstance(t, bytes) else t for t in log['topics']]
+                # Помечаем баланс для обновления после обнаружения перевода
+                if token_type == 'ERC20':
+                    for wallet in [transfer.from_address, transfer.to_address]:
+                        checksum_wallet = self.wallet_lower_to_checksum.get(wallet)
+                        if checksum_wallet:
+                            dirty_balances.add((checksum_wallet, contract_address))
+
+            elif transfer.event == ERC1155_TRANSFER_SINGLE_EVENT:
+                token_symbol, token_decimals = await self._get_token_info(contract_address, 'ERC1155')
+                event = TokenTransferEvent(
+                    tx_hash=tx_hash,
+                    block_number=block_number,
+                    token_address=contract_address,
+                    token_type='ERC1155',
+                    from_address=transfer.from_address,
+                    to_address=transfer.to_address,
+                    token_id=transfer.token_id,
+                    value=transfer.value,
+                    token_symbol=token_symbol,
+                    token_decimals=0
+                )
+                print(event)
 
-                    if not topics:
-                        continue
+            else:
+                token_symbol, token_decimals = await self._get_token_info(contract_address, 'ERC1155')
+                event = TokenTransferEvent(
+                    tx_hash=tx_hash,
+                    block_number=block_number,
+                    token_address=contract_address,
+                    token_type='ERC1155-Batch',
+                    from_address=transfer.from_address,
+                    to_address=transfer.to_address,
+                    token_id=None,
+                    value=None,
+                    token_symbol=token_symbol,
+                    token_decimals=0
+                )
+                print(f"{event} (Batch transfer - подробности в транзакции)")
 
-                    event_signature = topics[0]
-
-                    if event_signature == ERC20_TRANSFER_EVENT:
-                        if len(topics) >= 3:
-                            from_addr = '0x' + topics[1][26:].lower()
-                            to_addr = '0x' + topics[2][26:].lower()
-
-                            if from_addr in self.wallet_set or to_addr in self.wallet_set:
-                                # Добавляем токен в список отслеживаемых
-                                self.tracked_tokens.add(contract_address)
-
-                                token_type = await self._determine_token_type(contract_address)
-                                token_symbol, token_decimals = await self._get_token_info(contract_address, token_type)
-
-                                data_str = self._normalize_data(log['data'])
-
-                                if token_type == 'ERC721':
-                                    try:
-                                        token_id = int(data_str, 16) if data_str != '0x' else None
-                                    except ValueError:
-                                        logger.warning(f"Невозможно преобразовать данные в токен ID: {data_str}")
-                                        token_id = None
-
-                                    event = TokenTransferEvent(
-                                        tx_hash=tx_hash,
-                                        block_number=block_number,
-                                        token_address=contract_address,
-                                        token_type='ERC721',
-                                        from_address=from_addr,
-                                        to_address=to_addr,
-                                        token_id=token_id,
-                                        value=1,
-                                        token_symbol=token_symbol,
-                                        token_decimals=0
-                                    )
-                                else:
-                                    try:
-                                        value = int(data_str, 16) if data_str != '0x' else 0
-                                    except ValueError:
-                                        logger.warning(f"Невозможно преобразовать данные в значение: {data_str}")
-                                        value = 0
-
-                                    event = TokenTransferEvent(
-                                        tx_hash=tx_hash,
-                                        block_number=block_number,
-                                        token_address=contract_address,
-                                        token_type='ERC20',
-                                        from_address=from_addr,
-                                        to_address=to_addr,
-                                        value=value,
-                                        token_symbol=token_symbol,
-                                        token_decimals=token_decimals
-                                    )
-
-                                print(event)
-
-                                # Обновляем состояние баланса после обнаружения перевода
-                                for wallet in [from_addr, to_addr]:
-                                    if wallet in self.wallet_set:
-                                        # Находим соответствующий checksum адрес
-                                        checksum_wallet = None
-                                        for orig_addr in self.wallet_addresses_original:
-                                            if orig_addr.lower() == wallet:
-                                                checksum_wallet = orig_addr
-                                                break
-
-                                        if checksum_wallet:
-                                            balance_key = f"{wallet}:{contract_address}"
-                                            try:
-                                                if token_type == 'ERC20':
-                                                    checksum_address = Web3.to_checksum_address(contract_address)
-                                                    erc20_abi = [
-                                                        {"constant": True, "inputs": [{"name": "_owner", "type": "address"}],
-                                                         "name": "balanceOf", "outputs": [{"name": "balance", "type": "uint256"}],
-                                                         "type": "function"}
-                                                    ]
-
-                                                    contract = self.w3.eth.contract(address=checksum_address, abi=erc20_abi)
-                                                    new_balance = await asyncio.to_thread(
-                                                        contract.functions.balanceOf(checksum_wallet).call
-                                                    )
-                                                    self.wallet_balances[balance_key] = new_balance
-                                                    logger.debug(f"Обновлен баланс: {wallet} {token_symbol} = {new_balance / (10 ** token_decimals)}")
-                                            except Exception as e:
-                                                logger.error(f"Ошибка при обновлении баланса: {str(e)}")
-
-                    elif event_signature == ERC1155_TRANSFER_SINGLE_EVENT:
-                        if len(topics) >= 4:
-                            from_addr = '0x' + topics[2][26:].lower()
-                            to_addr = '0x' + topics[3][26:].lower()
-
-                            if from_addr in self.wallet_set or to_addr in self.wallet_set:
-                                # Добавляем токен в список отслеживаемых
-                                self.tracked_tokens.add(contract_address)
-
-                                token_symbol, token_decimals = await self._get_token_info(contract_address, 'ERC1155')
-                                data_str = self._normalize_data(log['data'])
-                                if data_str.startswith('0x'):
-                                    data_str = data_str[2:]
-
-                                if len(data_str) >= 128:
-                                    try:
-                                        token_id = int(data_str[:64], 16)
-                                        value = int(data_str[64:128], 16)
-                                    except ValueError as e:
-                                        logger.warning(f"Ошибка при преобразовании данных ERC1155: {str(e)}")
-                                        token_id = 0
-                                        value = 0
-
-                                    event = TokenTransferEvent(
-                                        tx_hash=tx_hash,
-                                        block_number=block_number,
-                                        token_address=contract_address,
-                                        token_type='ERC1155',
-                                        from_address=from_addr,
-                                        to_address=to_addr,
-                                        token_id=token_id,
-                                        value=value,
-                                        token_symbol=token_symbol,
-                                        token_decimals=0
-                                    )
-                                    print(event)
-
-                    elif event_signature == ERC1155_TRANSFER_BATCH_EVENT:
-                        if len(topics) >= 4:
-                            from_addr = '0x' + topics[2][26:].lower()
-                            to_addr = '0x' + topics[3][26:].lower()
-
-                            if from_addr in self.wallet_set or to_addr in self.wallet_set:
-                                # Добавляем токен в список отслеживаемых
-                                self.tracked_tokens.add(contract_address)
-
-                                token_symbol, token_decimals = await self._get_token_info(contract_address, 'ERC1155')
-                                event = TokenTransferEvent(
-                                    tx_hash=tx_hash,
-                                    block_number=block_number,
-                                    token_address=contract_address,
-                                    token_type='ERC1155-Batch',
-                                    from_address=from_addr,
-                                    to_address=to_addr,
-                                    token_id=None,
-                                    value=None,
-                                    token_symbol=token_symbol,
-                                    token_decimals=0
-                                )
-                                print(f"{event} (Batch transfer - подробности в транзакции)")
-
-        except TransactionNotFound:
-            logger.debug(f"Транзакция {tx_hash} не найдена при обработке")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке транзакции {tx_hash}: {str(e)}")
-
-    def _normalize_data(self, data) -> str:
-        if isinstance(data, bytes):
-            data_hex = data.hex()
-            if not data_hex.startswith('0x'):
-                data_hex = '0x' + data_hex
-            return data_hex
-        elif isinstance(data, str):
-            if not data.startswith('0x'):
-                return '0x' + data
-            return data
-        else:
-            return '0x' + str(data)
+        except (KeyError, TypeError, IndexError) as e:
+            logger.error("Ошибка при обработке транзакции %s: %s", tx_hash, e)
 
     async def _determine_token_type(self, contract_address: str) -> str:
+        # Тип контракта не меняется, supportsInterface запрашивается один раз на адрес
+        cache_key = contract_address.lower()
+        if cache_key in self.token_type_cache:
+            return self.token_type_cache[cache_key]
+
+        # Параллельные блоки ждут одну и ту же пробу вместо повторных запросов
+        probe = self.token_type_probes.get(cache_key)
+        if probe is None:
+            probe = self.token_type_probes[cache_key] = asyncio.ensure_future(self._probe_token_type(contract_address))
+        token_type = await probe
+
+        if cache_key not in self.token_type_cache:
+            self.token_type_cache[cache_key] = token_type
+            self.token_type_probes.pop(cache_key, None)
+            self._save_token_meta(cache_key, {'type': token_type})
+        return token_type
+
+    async def _probe_token_type(self, contract_address: str) -> str:
         try:
-            checksum_address = Web3.to_checksum_address(contract_address)
-            abi = [{"constant": True, "inputs": [{"name": "interfaceId", "type": "bytes4"}],
-                    "name": "supportsInterface", "outputs": [{"name": "", "type": "bool"}],
-                    "payable": False, "stateMutability": "view", "type": "function"}]
-
-            contract = self.w3.eth.contract(address=checksum_address, abi=abi)
+            checksum_address = to_checksum_address(contract_address)
 
             try:
-                supports_erc721 = await asyncio.to_thread(
-                    contract.functions.supportsInterface(Web3.to_bytes(hexstr='0x80ac58cd')).call
+                # Обе проверки supportsInterface одним eth_call через Multicall3
+                erc721_data, erc1155_data = await self._multicall(
+                    [(checksum_address, SUPPORTS_ERC721_CALLDATA), (checksum_address, SUPPORTS_ERC1155_CALLDATA)]
                 )
-                if supports_erc721:
-                    return 'ERC721'
-
-                supports_erc1155 = await asyncio.to_thread(
-                    contract.functions.supportsInterface(Web3.to_bytes(hexstr='0xd9b67a26')).call
-                )
-                if supports_erc1155:
-                    return 'ERC1155'
-            except Exception:
-                pass
-
-            erc20_abi = [
-                {"constant": True, "inputs": [], "name": "decimals",
-                 "outputs": [{"name": "", "type": "uint8"}], "type": "function"},
-                {"constant": True, "inputs": [], "name": "symbol",
-                 "outputs": [{"name": "", "type": "string"}], "type": "function"}
-            ]
-
-            erc20_contract = self.w3.eth.contract(address=checksum_address, abi=erc20_abi)
-            try:
-                await asyncio.to_thread(erc20_contract.functions.decimals().call) or \
-                await asyncio.to_thread(erc20_contract.functions.symbol().call)
-                return 'ERC20'
-            except Exception:
+                token_type = self._token_type_from(erc721_data, erc1155_data)
+                if token_type != 'ERC20':
+                    return token_type
+            except RPC_ERRORS:
                 pass
 
+            # Проба decimals/symbol сразу заполняет token_info_cache для следующего _get_token_info
+            await self._get_token_info(contract_address, 'ERC20')
             return 'ERC20'
-        except Exception as e:
-            logger.debug(f"Ошибка определения типа токена {contract_address}: {str(e)}")
+        except RPC_ERRORS as e:
+            logger.debug("Ошибка определения типа токена %s: %s", contract_address, e)
             return 'ERC20'
 
+    def _token_type_from(self, erc721_data: Optional[bytes], erc1155_data: Optional[bytes]) -> str:
+        if decode_bool(erc721_data):
+            return 'ERC721'
+        if decode_bool(erc1155_data):
+            return 'ERC1155'
+        return 'ERC20'
+
+    def _token_info_from(self, contract_address: str, token_type: str, symbol_data: Optional[bytes],
+                         decimals_data: Optional[bytes], name_data: Optional[bytes]) -> Tuple[str, int]:
+        if token_type in ['ERC721', 'ERC1155']:
+            symbol = decode_string(symbol_data) or decode_string(name_data)
+            if symbol is None:
+                logger.debug("Не удалось получить имя/символ NFT %s", contract_address)
+                symbol = f"{token_type}-{contract_address[-6:]}"
+            return symbol, 0
+
+        symbol = decode_string(symbol_data)
+        if symbol is None:
+            logger.debug("Не удалось получить символ токена %s", contract_address)
+            symbol = "UNKNOWN"
+
+        decimals = decode_uint8(decimals_data)
+        if decimals is None:
+            logger.debug("Не удалось получить decimals токена %s", contract_address)
+            decimals = 18
+        return symbol, decimals
+
+    async def _prefetch_token_meta(self, addresses: List[str]):
+        """Тип и метаданные всех новых токенов окна одним eth_call через Multicall3"""
+        missing = [address for address in dict.fromkeys(addresses)
+                   if address not in self.token_type_cache or address not in self.token_info_cache]
+
+        for batch_start in range(0, len(missing), TOKEN_META_BATCH_SIZE):
+            batch = missing[batch_start:batch_start + TOKEN_META_BATCH_SIZE]
+            calls = []
+            for address in batch:
+                checksum_address = to_checksum_address(address)
+                calls += [(checksum_address, SUPPORTS_ERC721_CALLDATA), (checksum_address, SUPPORTS_ERC1155_CALLDATA),
+                          (checksum_address, SYMBOL_SELECTOR), (checksum_address, DECIMALS_SELECTOR),
+                          (checksum_address, NAME_SELECTOR)]
+            try:
+                results = await self._multicall(calls)
+            except RPC_ERRORS as e:
+                # Токены без метаданных дочитываются поштучно в _determine_token_type/_get_token_info
+                logger.debug("Не удалось получить метаданные %s токенов: %s", len(batch), e)
+                continue
+
+            for i, address in enumerate(batch):
+                erc721_data, erc1155_data, symbol_data, decimals_data, name_data = results[5 * i:5 * i + 5]
+                token_type = self.token_type_cache.get(address) or self._token_type_from(erc721_data, erc1155_data)
+                symbol, decimals = self.token_info_cache.get(address) or self._token_info_from(
+                    address, token_type, symbol_data, decimals_data, name_data)
+                self.token_type_cache[address] = token_type
+                self.token_info_cache[address] = (symbol, decimals)
+                self._save_token_meta(address, {'type': token_type, 'symbol': symbol, 'decimals': decimals})
+
     async def _get_token_info(self, contract_address: str, token_type: str) -> Tuple[str, int]:
         cache_key = contract_address.lower()
         if cache_key in self.token_info_cache:
@@ -572,57 +1115,29 @@ class PolygonScanner:
         decimals = 18
 
         try:
-            checksum_address = Web3.to_checksum_address(contract_address)
+            checksum_address = to_checksum_address(contract_address)
 
             if token_type == 'ERC20':
-                erc20_abi = [
-                    {"constant": True, "inputs": [], "name": "decimals",
-                     "outputs": [{"name": "", "type": "uint8"}], "type": "function"},
-                    {"constant": True, "inputs": [], "name": "symbol",
-                     "outputs": [{"name": "", "type": "string"}], "type": "function"}
-                ]
-
-                contract = self.w3.eth.contract(address=checksum_address, abi=erc20_abi)
-
-                try:
-                    symbol = await asyncio.to_thread(contract.functions.symbol().call)
-                except Exception as e:
-                    logger.debug(f"Не удалось получить символ токена {contract_address}: {str(e)}")
-
-                try:
-                    decimals = await asyncio.to_thread(contract.functions.decimals().call)
-                except Exception as e:
-                    logger.debug(f"Не удалось получить decimals токена {contract_address}: {str(e)}")
+                # symbol() и decimals() одним eth_call через Multicall3
+                symbol_data, decimals_data = await self._multicall(
+                    [(checksum_address, SYMBOL_SELECTOR), (checksum_address, DECIMALS_SELECTOR)]
+                )
+                symbol, decimals = self._token_info_from(contract_address, token_type, symbol_data, decimals_data, None)
 
             elif token_type in ['ERC721', 'ERC1155']:
-                nft_abi = [
-                    {"constant": True, "inputs": [], "name": "symbol",
-                     "outputs": [{"name": "", "type": "string"}], "type": "function"},
-                    {"constant": True, "inputs": [], "name": "name",
-                     "outputs": [{"name": "", "type": "string"}], "type": "function"}
-                ]
-
-                contract = self.w3.eth.contract(address=checksum_address, abi=nft_abi)
-
-                try:
-                    symbol = await asyncio.to_thread(contract.functions.symbol().call)
-                except Exception:
-                    try:
-                        symbol = await asyncio.to_thread(contract.functions.name().call)
-                    except Exception as e:
-                        logger.debug(f"Не удалось получить имя/символ NFT {contract_address}: {str(e)}")
-                        symbol = f"{token_type}-{contract_address[-6:]}"
-
-                decimals = 0
-
-            self.token_info_cache[cache_key] = (symbol, decimals)
-            return symbol, decimals
+                symbol_data, name_data = await self._multicall(
+                    [(checksum_address, SYMBOL_SELECTOR), (checksum_address, NAME_SELECTOR)]
+                )
+                symbol, decimals = self._token_info_from(contract_address, token_type, symbol_data, None, name_data)
 
-        except Exception as e:
-            logger.warning(f"Ошибка при получении информации о токене {contract_address}: {str(e)}")
             self.token_info_cache[cache_key] = (symbol, decimals)
+            self._save_token_meta(cache_key, {'symbol': symbol, 'decimals': decimals})
             return symbol, decimals
 
+        except RPC_ERRORS as e:
+            logger.warning("Ошибка при получении информации о токене %s: %s", contract_address, e)
+            # Параллельный запрос мог уже сохранить настоящие метаданные
+            return self.token_info_cache.setdefault(cache_key, (symbol, decimals))
 
 async def main():
     wallets = [
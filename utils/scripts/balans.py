@@ -19,8 +19,13 @@
 # For commercial licensing, contact: licensing@linkora.info
 
 from web3 import Web3
+from web3.exceptions import ProviderConnectionError
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 load_dotenv()
 
 # Конфигурация
@@ -28,13 +33,37 @@ RPC_URL = "https://rpc.ankr.com/polygon/fb00ba52a7de8c2eb4acca0df559055367349133
 USER1 = os.getenv('USER1')
 USER1_PRIVATE_KEY = os.getenv('USER1_PRIVATE_KEY')
 
-# Подключение к сети
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
 
-# Проверка подключения и получение баланса
-if w3.is_connected():
-   balance_wei = w3.eth.get_balance(USER1)
-   balance_matic = w3.from_wei(balance_wei, 'ether')
-   print(f"Баланс: {balance_matic} MATIC")
-else:
-   print("Ошибка подключения к сети")
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_w3():
+    # Подключение создается один раз на процесс, повторные вызовы get_balance() используют его сессию
+    # HTTP keep-alive: все запросы к RPC идут через одно TCP/TLS-соединение
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=8,
+        # 429 повторяется после паузы из Retry-After; JSON-RPC идет POST-запросами
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429], allowed_methods=frozenset({'POST'}))
+    ))
+    return Web3(Web3.HTTPProvider(RPC_URL, session=session))
+
+
+def wei_to_matic_str(wei):
+    """Сумма в wei строкой MATIC без Decimal: целая и дробная часть делением нацело"""
+    whole, fraction = divmod(wei, 10 ** 18)
+    return f"{whole}.{fraction:018d}".rstrip('0').rstrip('.')
+
+
+def get_balance(address=USER1):
+    """Баланс адреса в wei"""
+    return get_w3().eth.get_balance(address)
+
+
+if __name__ == "__main__":
+    # Без отдельной проверки подключения: ошибку сети покажет сам запрос баланса
+    try:
+        balance_wei = get_balance()
+    except (requests.ConnectionError, ProviderConnectionError) as e:
+        print(f"Ошибка подключения к сети: {e}")
+    else:
+        print(f"Баланс: {wei_to_matic_str(balance_wei)} MATIC")
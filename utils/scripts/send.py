@@ -18,55 +18,111 @@
 #
 # For commercial licensing, contact: licensing@linkora.info
 
-from web3 import Web3
+from web3.exceptions import ProviderConnectionError
+from eth_keys import keys
+from eth_utils import decode_hex, keccak, to_checksum_address
+import rlp
 from dotenv import load_dotenv
+from balans import get_w3, wei_to_matic_str
 import os
+import time
+import requests
 load_dotenv()
 
-RPC_URL = "https://rpc.ankr.com/polygon/fb00ba52a7de8c2eb4acca0df5590553673491333704db7739fbdf8a40d0f1ad"
 USER1 = os.getenv('USER1')
 USER1_PRIVATE_KEY = os.getenv('USER1_PRIVATE_KEY')
 RECIPIENT = "0x9320D18D37777F6897aaa57Df36251633A5925D2"
 TRANSFER_AMOUNT = 0.5
+# Переводы (получатель, сумма в MATIC), подписываются подряд и отправляются одним batch
+TRANSFERS = [(RECIPIENT, TRANSFER_AMOUNT)]
+GAS_LIMIT = 21000
+CHAIN_ID = 137
 
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# Ключ разбирается один раз при импорте, подпись транзакции - только ECDSA.
+# eth_keys сам использует coincurve (libsecp256k1), если он установлен
+PRIVATE_KEY = keys.PrivateKey(decode_hex(USER1_PRIVATE_KEY)) if USER1_PRIVATE_KEY else None
 
-if not w3.is_connected():
-    print("Ошибка подключения к сети")
-    exit()
 
-if not w3.is_address(RECIPIENT):
-    print("Некорректный адрес получателя")
-    exit()
+def sign_transfer(nonce, gas_price, to_bytes, value):
+    """Подписанная legacy-транзакция (EIP-155) перевода MATIC в RLP"""
+    # Форма перевода известна заранее, поэтому RLP собирается напрямую, без
+    # общего нормализатора транзакций web3/eth_account
+    fields = [nonce, gas_price, GAS_LIMIT, to_bytes, value, b'']
+    signature = PRIVATE_KEY.sign_msg_hash(keccak(rlp.encode(fields + [CHAIN_ID, 0, 0])))
+    return rlp.encode(fields + [signature.v + CHAIN_ID * 2 + 35, signature.r, signature.s])
 
-balance_wei = w3.eth.get_balance(USER1)
-balance_matic = w3.from_wei(balance_wei, 'ether')
-transfer_wei = w3.to_wei(TRANSFER_AMOUNT, 'ether')
 
-gas_price = w3.eth.gas_price
-gas_limit = 21000
-transaction_cost = gas_price * gas_limit
-total_cost = transfer_wei + transaction_cost
+# Цена газа в Polygon меняется не чаще блока (~2 с), повторные отправки берут ее из кэша
+GAS_PRICE_TTL = 2.0
+_gas_price_cache = {'value': None, 'time': 0.0}
 
-if balance_wei < total_cost:
-    print(f"Недостаточно средств. Баланс: {balance_matic} MATIC, требуется: {w3.from_wei(total_cost, 'ether')} MATIC")
-    exit()
 
-nonce = w3.eth.get_transaction_count(USER1)
+def cached_gas_price():
+    if time.monotonic() - _gas_price_cache['time'] > GAS_PRICE_TTL:
+        return None
+    return _gas_price_cache['value']
 
-transaction = {
-    'to': RECIPIENT,
-    'value': transfer_wei,
-    'gas': gas_limit,
-    'gasPrice': gas_price,
-    'nonce': nonce,
-    'chainId': 137,
-}
 
-signed_txn = w3.eth.account.sign_transaction(transaction, USER1_PRIVATE_KEY)
-tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+def store_gas_price(gas_price):
+    _gas_price_cache.update(value=gas_price, time=time.monotonic())
 
-print(f"Транзакция отправлена: {tx_hash.hex()}")
-print(f"Переведено: {TRANSFER_AMOUNT} MATIC")
-print(f"Получатель: {RECIPIENT}")
-print(f"Комиссия: {w3.from_wei(transaction_cost, 'ether')} MATIC")
\ No newline at end of file
+
+def send(transfers):
+    """Отправка переводов [(получатель, сумма в MATIC)], возвращает хеши транзакций"""
+    w3 = get_w3()
+
+    for recipient, _ in transfers:
+        if not w3.is_address(recipient):
+            print(f"Некорректный адрес получателя: {recipient}")
+            return []
+
+    # Баланс, nonce и устаревшая цена газа одним JSON-RPC batch-запросом.
+    # Отдельной проверки подключения нет: ошибку сети покажет этот запрос
+    gas_price = cached_gas_price()
+    try:
+        with w3.batch_requests() as batch:
+            batch.add(w3.eth.get_balance(USER1))
+            batch.add(w3.eth.get_transaction_count(USER1))
+            if gas_price is None:
+                batch.add(w3.eth.gas_price)
+            balance_wei, nonce, *fresh_gas_price = batch.execute()
+    except (requests.ConnectionError, ProviderConnectionError) as e:
+        print(f"Ошибка подключения к сети: {e}")
+        return []
+
+    if gas_price is None:
+        gas_price = fresh_gas_price[0]
+        store_gas_price(gas_price)
+
+    # Получатель сразу в виде 20 байт для RLP
+    # is_address принимает и адреса без 0x: приводим к каноническому виду, иначе срез [2:] дал бы 19 байт
+    transfers_wei = [(decode_hex(to_checksum_address(recipient)), w3.to_wei(amount, 'ether'))
+                     for recipient, amount in transfers]
+
+    transaction_cost = gas_price * GAS_LIMIT
+    total_cost = sum(transfer_wei for _, transfer_wei in transfers_wei) + transaction_cost * len(transfers_wei)
+
+    if balance_wei < total_cost:
+        print(f"Недостаточно средств. Баланс: {wei_to_matic_str(balance_wei)} MATIC, "
+              f"требуется: {wei_to_matic_str(total_cost)} MATIC")
+        return []
+
+    # nonce запрошен один раз, для следующих транзакций увеличивается локально
+    raw_transactions = [sign_transfer(nonce + i, gas_price, to_bytes, transfer_wei)
+                        for i, (to_bytes, transfer_wei) in enumerate(transfers_wei)]
+
+    with w3.batch_requests() as batch:
+        for raw_transaction in raw_transactions:
+            batch.add(w3.eth.send_raw_transaction(raw_transaction))
+        tx_hashes = batch.execute()
+
+    for tx_hash, (recipient, amount) in zip(tx_hashes, transfers):
+        print(f"Транзакция отправлена: {tx_hash.hex()}")
+        print(f"Переведено: {amount} MATIC")
+        print(f"Получатель: {recipient}")
+        print(f"Комиссия: {wei_to_matic_str(transaction_cost)} MATIC")
+    return tx_hashes
+
+
+if __name__ == "__main__":
+    send(TRANSFERS)